@@ -0,0 +1,303 @@
+"""
+Local stand-in for the WorldQuant Brain API, for offline benchmarks.
+
+Implements the endpoints worldquant.py uses: /authentication, /simulations
+(single and multi) with progress URLs and DELETE, /alphas/{id}, recordsets
+(pnl, turnover), correlations/self, before-and-after-performance,
+/data-fields and /operators. Simulation time, Retry-After, 429 throttling,
+server concurrency, per-request latency and failures are configurable.
+Results are deterministic: an alpha's metrics depend only on its expression
+and settings.
+
+    python benchmark/mock_brain.py --port 8787 --sim-seconds 2
+    BRAIN_API_URL=http://127.0.0.1:8787 python run_action.py
+"""
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class MockConfig:
+    def __init__(self, sim_seconds=2.0, queue_seconds=0.5, retry_after=0.5, concurrency=3, throttle_rate=0.0,
+                 latency=0.0, fail_rate=0.0, recordset_delay=0.0, days=1000, seed=0):
+        self.sim_seconds = sim_seconds          # thời gian chạy một simulation
+        self.queue_seconds = queue_seconds      # thời gian chờ trong hàng đợi server trước khi chạy
+        self.retry_after = retry_after          # header Retry-After của progress URL
+        self.concurrency = concurrency          # số simulation chạy cùng lúc, vượt thì 429
+        self.throttle_rate = throttle_rate      # tỉ lệ POST /simulations bị 429 ngẫu nhiên
+        self.latency = latency                  # độ trễ thêm vào mỗi request
+        self.fail_rate = fail_rate              # tỉ lệ simulation FAILED
+        self.recordset_delay = recordset_delay  # recordset chỉ có sau từng này giây kể từ khi alpha xong
+        self.days = days                        # số ngày của pnl/turnover
+        self.seed = seed
+
+
+def stable_random(*parts):
+    """random.Random seeded by `parts`, so the same alpha always gets the same numbers."""
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+class MockBrainState:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.simulations = {}  # id -> dict
+        self.alphas = {}       # alpha id -> dict
+        self.random = random.Random(config.seed)
+        self.requests = 0
+
+    def running(self, now):
+        return sum(1 for sim in self.simulations.values()
+                   if not sim.get('child') and not sim.get('cancelled') and now < sim['done_at'])
+
+    def submit(self, payload):
+        """Create a simulation; returns its id, or None when the server is at its concurrency limit."""
+        now = time.monotonic()
+        with self.lock:
+            if self.running(now) >= self.config.concurrency:
+                return None
+            sim_id = f'sim{next(self.ids)}'
+            sim = {'created': now, 'done_at': now + self.config.queue_seconds + self.config.sim_seconds}
+            if isinstance(payload, list):
+                sim['children'] = []
+                for child_payload in payload:
+                    child_id = f'sim{next(self.ids)}'
+                    self.simulations[child_id] = self._result({'child': True, 'done_at': sim['done_at']}, child_payload)
+                    sim['children'].append(child_id)
+            else:
+                self._result(sim, payload)
+            self.simulations[sim_id] = sim
+            return sim_id
+
+    def _result(self, sim, payload):
+        if self.random.random() < self.config.fail_rate:
+            sim['failed'] = True
+            return sim
+        settings = payload.get('settings', {})
+        alpha_id = hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:7]
+        sim['alpha'] = alpha_id
+        self.alphas[alpha_id] = {'payload': payload, 'settings': settings, 'done_at': sim['done_at']}
+        return sim
+
+    def progress(self, sim_id):
+        now = time.monotonic()
+        with self.lock:
+            sim = self.simulations.get(sim_id)
+        if sim is None or sim.get('cancelled'):
+            return 404, {'detail': 'Not found.'}, {}
+        if now < sim['done_at']:
+            body = {}
+            if now >= sim['done_at'] - self.config.sim_seconds:
+                body['progress'] = round(1 - (sim['done_at'] - now) / max(self.config.sim_seconds, 1e-9), 2)
+            return 200, body, {'Retry-After': str(self.config.retry_after)}
+        if sim.get('failed'):
+            return 200, {'status': 'ERROR', 'message': 'Simulated failure'}, {}
+        if 'children' in sim:
+            return 200, {'status': 'COMPLETE', 'children': sim['children']}, {}
+        return 200, {'status': 'COMPLETE', 'alpha': sim['alpha']}, {}
+
+    def cancel(self, sim_id):
+        with self.lock:
+            sim = self.simulations.get(sim_id)
+            if sim is None:
+                return False
+            sim['cancelled'] = True
+            return True
+
+    def alpha(self, alpha_id):
+        entry = self.alphas.get(alpha_id)
+        if entry is None:
+            return None
+        payload, settings = entry['payload'], entry['settings']
+        rnd = stable_random(payload.get('regular'), json.dumps(settings, sort_keys=True))
+        sharpe = round(rnd.uniform(-2.5, 2.5), 2)
+        turnover = round(rnd.uniform(0.01, 0.9), 4)
+        returns = round(rnd.uniform(-0.2, 0.2), 4)
+        checks = [{'name': name, 'result': rnd.choice(['PASS', 'FAIL'])}
+                  for name in ['LOW_SHARPE', 'LOW_FITNESS', 'LOW_TURNOVER', 'HIGH_TURNOVER',
+                               'CONCENTRATED_WEIGHT', 'LOW_SUB_UNIVERSE_SHARPE']]
+        return {
+            'id': alpha_id,
+            'regular': {'code': payload.get('regular')},
+            'settings': settings,
+            'is': {
+                'sharpe': sharpe,
+                'turnover': turnover,
+                'fitness': round(sharpe * abs(returns) ** 0.5 / max(turnover, 0.125) ** 0.5, 2),
+                'returns': returns,
+                'drawdown': round(rnd.uniform(0.01, 0.4), 4),
+                'margin': round(rnd.uniform(-0.001, 0.002), 6),
+                'longCount': rnd.randint(500, 1500),
+                'shortCount': rnd.randint(500, 1500),
+                'checks': checks,
+            },
+        }
+
+    def recordset(self, alpha_id, name):
+        entry = self.alphas.get(alpha_id)
+        if entry is None:
+            return 404, None
+        if time.monotonic() < entry['done_at'] + self.config.recordset_delay:
+            return 200, None # chưa tạo xong, kèm Retry-After
+        rnd = stable_random(alpha_id, name)
+        start = datetime.date(2018, 1, 1)
+        records, value = [], 0.0
+        for day in range(self.config.days):
+            date = (start + datetime.timedelta(days=day)).isoformat()
+            if name == 'pnl':
+                value += rnd.gauss(0, 1e5)
+                records.append([date, round(value, 2)])
+            else:
+                records.append([date, round(rnd.uniform(0, 0.5), 4)])
+        return 200, {'records': records}
+
+
+class MockBrainHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _reply(self, status, body=None, headers=None):
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _begin(self):
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.config.latency:
+            time.sleep(self.state.config.latency)
+        return urlparse(self.path)
+
+    def do_POST(self):
+        url = self._begin()
+        payload = self._body()
+        if url.path == '/authentication':
+            return self._reply(201, {'user': {'id': 'MOCK'}, 'token': {'expiry': 14400}})
+        if url.path == '/simulations':
+            config = self.state.config
+            if self.state.random.random() < config.throttle_rate:
+                return self._reply(429, {'detail': 'Too many requests'}, {'Retry-After': str(config.retry_after)})
+            sim_id = self.state.submit(payload)
+            if sim_id is None:
+                return self._reply(429, {'detail': 'CONCURRENT_SIMULATION_LIMIT_EXCEEDED'},
+                                   {'Retry-After': str(config.retry_after)})
+            location = f'http://{self.headers.get("Host")}/simulations/{sim_id}'
+            return self._reply(201, None, {'Location': location, 'Retry-After': str(config.retry_after)})
+        self._reply(404, {'detail': 'Not found.'})
+
+    def do_DELETE(self):
+        url = self._begin()
+        match = re.match(r'^/simulations/([^/]+)$', url.path)
+        if match and self.state.cancel(match.group(1)):
+            return self._reply(204)
+        self._reply(404, {'detail': 'Not found.'})
+
+    def do_GET(self):
+        url = self._begin()
+        path = url.path.rstrip('/')
+        if path == '/authentication':
+            return self._reply(200, {'user': {'id': 'MOCK'}})
+
+        match = re.match(r'^/simulations/([^/]+)$', path)
+        if match:
+            status, body, headers = self.state.progress(match.group(1))
+            return self._reply(status, body, headers)
+
+        match = re.match(r'^/alphas/([^/]+)$', path)
+        if match:
+            alpha = self.state.alpha(match.group(1))
+            return self._reply(200, alpha) if alpha else self._reply(404, {'detail': 'Not found.'})
+
+        match = re.match(r'^/alphas/([^/]+)/recordsets/([^/]+)$', path)
+        if match:
+            status, body = self.state.recordset(match.group(1), match.group(2))
+            return self._reply(status, body, {} if body else {'Retry-After': str(self.state.config.retry_after)})
+
+        match = re.match(r'^/alphas/([^/]+)/correlations/self$', path)
+        if match:
+            rnd = stable_random(match.group(1), 'corr')
+            low = round(rnd.uniform(-0.5, 0.3), 4)
+            return self._reply(200, {'min': low, 'max': round(rnd.uniform(max(low, 0.1), 0.9), 4)})
+
+        match = re.match(r'^/competitions/[^/]+/alphas/([^/]+)/before-and-after-performance$', path)
+        if match:
+            rnd = stable_random(match.group(1), 'score')
+            before = round(rnd.uniform(1000, 5000), 2)
+            return self._reply(200, {'score': {'before': before, 'after': round(before + rnd.uniform(-50, 150), 2)}})
+
+        if path == '/data-fields':
+            query = parse_qs(url.query)
+            offset, limit = int(query.get('offset', ['0'])[0]), int(query.get('limit', ['50'])[0])
+            count = 500
+            results = [{'id': f'mock_field_{i}', 'description': f'Mock field {i}', 'type': 'MATRIX',
+                        'dataset': {'id': 'mock', 'name': 'Mock Dataset'}, 'coverage': 1.0,
+                        'userCount': i, 'alphaCount': i} for i in range(offset, min(offset + limit, count))]
+            return self._reply(200, {'count': count, 'results': results})
+
+        if path == '/operators':
+            return self._reply(200, [{'name': name, 'category': 'Mock'} for name in ['rank', 'ts_mean', 'zscore']])
+
+        self._reply(404, {'detail': 'Not found.'})
+
+
+def start_mock_server(port=0, host='127.0.0.1', **config):
+    """Serve the mock API on a daemon thread; returns (server, base_url). `server.state` holds the simulations."""
+    server = ThreadingHTTPServer((host, port), MockBrainHandler)
+    server.daemon_threads = True
+    server.state = MockBrainState(MockConfig(**config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local mock of the WorldQuant Brain API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--sim-seconds', type=float, default=2.0)
+    parser.add_argument('--queue-seconds', type=float, default=0.5)
+    parser.add_argument('--retry-after', type=float, default=0.5)
+    parser.add_argument('--concurrency', type=int, default=3)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--recordset-delay', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.port, args.host, sim_seconds=args.sim_seconds,
+                                         queue_seconds=args.queue_seconds, retry_after=args.retry_after,
+                                         concurrency=args.concurrency, throttle_rate=args.throttle_rate,
+                                         latency=args.latency, fail_rate=args.fail_rate,
+                                         recordset_delay=args.recordset_delay, seed=args.seed)
+    print(f'Mock Brain API đang chạy tại {base_url} (Ctrl+C để dừng)')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
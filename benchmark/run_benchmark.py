@@ -0,0 +1,257 @@
+"""
+End-to-end throughput benchmark against the local mock Brain API.
+
+Drives WorldQuant.simulate, Optimize.best_alpha and ComBine.run_v2 through
+the real client code (session, executor, caches, sinks) with every request
+going to benchmark/mock_brain.py, and reports simulations/hour, request
+counts and p50/p99 latencies per endpoint from wq.metrics.
+
+    python benchmark/run_benchmark.py
+    python benchmark/run_benchmark.py --scenarios simulate --alphas 60 --sim-seconds 1 --json bench.json
+    python benchmark/run_benchmark.py --baseline bench.json --tolerance 0.1   # exit 1 on regression
+    python benchmark/run_benchmark.py --initial-slots 3 --max-slots 3   # cố định giới hạn client, bỏ qua AIMD
+    python benchmark/run_benchmark.py --record cassettes/       # ghi traffic của từng kịch bản
+    python benchmark/run_benchmark.py --replay cassettes/ --replay-speed 0   # phát lại offline, không chờ
+
+Each scenario gets a fresh mock server and empty caches in a temporary
+directory, so nothing is answered from a previous run. With --replay no
+server is started: the client is fed the recorded responses (see cassette.py),
+which isolates client-side overhead from server timing.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Lấy đường dẫn thư mục cha
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Thêm vào sys.path nếu chưa có
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import pandas as pd
+
+from benchmark.mock_brain import start_mock_server
+from cache import RecordsetStore
+from result_sink import AsyncWriter, CsvSink
+
+FIELDS = ['close', 'open', 'high', 'low', 'volume', 'vwap', 'returns', 'adv20', 'cap']
+OPERATORS = ['rank({})', 'zscore({})', 'ts_mean({}, 20)', 'ts_rank({}, 60)', '-ts_delta({}, 5)']
+
+
+def make_alphas(n):
+    """`n` distinct expressions."""
+    alphas = []
+    for i in range(n):
+        field = FIELDS[i % len(FIELDS)]
+        operator = OPERATORS[(i // len(FIELDS)) % len(OPERATORS)]
+        alphas.append(f'{operator.format(field)} * {1 + i // (len(FIELDS) * len(OPERATORS))}')
+    return alphas
+
+
+class Workspace:
+    """Mock server + WorldQuant client with caches in a temporary directory."""
+
+    def __init__(self, name, args):
+        from worldquant import WorldQuant
+
+        self.tmp = tempfile.TemporaryDirectory(prefix='brain-bench-')
+        self.server = None
+        os.environ.pop('BRAIN_CASSETTE', None)
+        if args.replay:
+            os.environ['BRAIN_CASSETTE'] = os.path.join(args.replay, name + '.jsonl')
+            os.environ['BRAIN_CASSETTE_MODE'] = 'replay'
+            os.environ['BRAIN_REPLAY_SPEED'] = str(args.replay_speed)
+        else:
+            self.server, base_url = start_mock_server(
+                sim_seconds=args.sim_seconds, queue_seconds=args.queue_seconds, retry_after=args.retry_after,
+                concurrency=args.concurrency, throttle_rate=args.throttle_rate, latency=args.latency,
+                fail_rate=args.fail_rate, recordset_delay=args.recordset_delay, seed=args.seed)
+            os.environ['BRAIN_API_URL'] = base_url
+            if args.record:
+                os.environ['BRAIN_CASSETTE'] = os.path.join(args.record, name + '.jsonl')
+                os.environ['BRAIN_CASSETTE_MODE'] = 'record'
+
+        credentials_path = self.path('credential.json')
+        with open(credentials_path, 'w') as f:
+            json.dump({'username': 'bench', 'password': 'bench'}, f)
+        self.wq = WorldQuant(credentials_path, cache_path=self.path('simulations.sqlite'),
+                             journal_path=self.path('jobs.sqlite'))
+        self.wq.recordsets = RecordsetStore(self.path('recordsets'))
+        # mặc định giữ giới hạn AIMD của client để đo cả phần tăng / giảm theo 429 của server giả lập
+        self.wq.controller.configure(initial=args.initial_slots, maximum=args.max_slots)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def writer(self, name):
+        return AsyncWriter(CsvSink(self.path(name + '.csv')), journal_path=self.path(name + '.journal.jsonl'))
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.tmp.cleanup()
+
+
+def run_simulate(ws, args):
+    alphas = make_alphas(args.alphas)
+    return ws.wq.simulate(alphas, sink=CsvSink(ws.path('simulate.csv')), batch_size=args.batch_size)
+
+
+def run_optimize(ws, args):
+    from optimize.optimize import Optimize
+
+    opti = Optimize()
+    opti.wl = ws.wq
+    opti._sheet_writer = ws.writer('optimize')
+    alpha = args.optimize_alpha
+    simulate_result = ws.wq.single_simulate(alpha, get_corr_and_score=False)
+    fields_ops = opti.extract(alpha)
+    fields = list(set(fields_ops['fields']) - set(opti.groups))
+    alpha, simulate_result = opti.best_alpha(alpha, simulate_result, fields, optimize_type='field')
+    alpha, simulate_result = opti.best_alpha(alpha, simulate_result, fields_ops['operators'], optimize_type='operator')
+    opti.sheet_writer.close()
+    return None
+
+
+def run_combine(ws, args):
+    from combine.combine_v2 import ComBine
+
+    # dựng ComBine không qua __init__ (không cần Google Sheet): database là các alpha vừa simulate
+    combine = ComBine.__new__(ComBine)
+    combine.date = time.strftime('%d-%m-%Y')
+    combine.wl = ws.wq
+    combine.combine_writer = ws.writer('combine')
+    combine.main_combine_writer = ws.writer('main_combine')
+    rows = []
+    for record in ws.wq.simulate_iter(make_alphas(args.combine_alphas), get_corr_and_score=False):
+        if record['status'] == 'COMPLETE':
+            settings = str({key: value for key, value in record['settings'].items() if key == 'neutralization'})
+            rows.append({'date': combine.date, 'id': record['expression'], 'alpha': record['expression'],
+                         'settings': settings, 'code': record['alpha_id']})
+    combine.main_database = pd.DataFrame(rows)
+    combine.run_v2()
+    combine.close()
+    return None
+
+
+SCENARIOS = {'simulate': run_simulate, 'optimize': run_optimize, 'combine': run_combine}
+
+
+def simulations_completed(ws):
+    """Simulations the mock finished (multi-simulation children counted individually)."""
+    if ws.server is None: # phát lại: đếm theo phase của client
+        return (ws.wq.metrics.snapshot()['phases'].get('total') or {}).get('count', 0)
+    with ws.server.state.lock:
+        return sum(1 for sim in ws.server.state.simulations.values()
+                   if 'children' not in sim and not sim.get('cancelled'))
+
+
+def run_scenario(name, args):
+    ws = Workspace(name, args)
+    try:
+        started = time.monotonic()
+        SCENARIOS[name](ws, args)
+        ws.wq.enrichment.join()
+        elapsed = time.monotonic() - started
+        snapshot = ws.wq.metrics.snapshot()
+        simulations = simulations_completed(ws)
+        endpoints = {}
+        for endpoint, entry in sorted(snapshot['endpoints'].items()):
+            latency = entry.get('latency') or {}
+            endpoints[endpoint] = {
+                'requests': sum(entry['requests'].values()),
+                'retries': sum(entry['retries'].values()),
+                'errors': sum(entry['errors'].values()),
+                'p50': latency.get('p50'),
+                'p99': latency.get('p99'),
+            }
+        return {
+            'seconds': round(elapsed, 3),
+            'simulations': simulations,
+            'simulations_per_hour': round(simulations / elapsed * 3600, 1) if elapsed else None,
+            'requests': sum(entry['requests'] for entry in endpoints.values()),
+            'server_requests': ws.server.state.requests if ws.server else None,
+            'endpoints': endpoints,
+            'phases': snapshot['phases'],
+            'controller': ws.wq.controller.metrics(),
+        }
+    finally:
+        ws.close()
+
+
+def print_report(results):
+    def ms(value):
+        return '-' if value is None else f'{value * 1000:.1f}'
+
+    for name, result in results.items():
+        print(f"\n=== {name}: {result['simulations']} simulation trong {result['seconds']}s "
+              f"-> {result['simulations_per_hour']} simulation/giờ, {result['requests']} request ===")
+        controller = result['controller']
+        print(f"controller: limit={controller['limit']} max_limit={controller['max_limit']} "
+              f"accepted={controller['accepted']} throttles={controller['throttles']}")
+        print(f"{'endpoint':<62} {'req':>6} {'retry':>6} {'err':>5} {'p50 ms':>9} {'p99 ms':>9}")
+        for endpoint, entry in result['endpoints'].items():
+            print(f"{endpoint:<62} {entry['requests']:>6} {entry['retries']:>6} {entry['errors']:>5} "
+                  f"{ms(entry['p50']):>9} {ms(entry['p99']):>9}")
+        for phase, histogram in result['phases'].items():
+            print(f"  phase {phase:<12} n={histogram['count']:<5} p50={ms(histogram['p50'])}ms p99={ms(histogram['p99'])}ms")
+
+
+def compare(results, baseline, tolerance):
+    """Names of scenarios whose simulations/hour dropped more than `tolerance` below the baseline."""
+    regressions = []
+    for name, result in results.items():
+        before = (baseline.get(name) or {}).get('simulations_per_hour')
+        after = result['simulations_per_hour']
+        if before and after is not None and after < before * (1 - tolerance):
+            print(f"REGRESSION {name}: {after} < {before} simulation/giờ (tolerance {tolerance:.0%})")
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the WorldQuant client against the mock Brain API')
+    parser.add_argument('--scenarios', default='simulate,optimize,combine')
+    parser.add_argument('--alphas', type=int, default=30, help='số alpha cho kịch bản simulate')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--combine-alphas', type=int, default=5)
+    parser.add_argument('--optimize-alpha', default='rank(anl4_bac1actualqfv110_actual)')
+    parser.add_argument('--sim-seconds', type=float, default=1.0)
+    parser.add_argument('--queue-seconds', type=float, default=0.2)
+    parser.add_argument('--retry-after', type=float, default=0.2)
+    parser.add_argument('--concurrency', type=int, default=3, help='giới hạn simulation song song của server giả lập')
+    parser.add_argument('--initial-slots', type=int, help='giới hạn ban đầu của client (mặc định của ConcurrencyController)')
+    parser.add_argument('--max-slots', type=int, help='giới hạn tối đa của client (mặc định của ConcurrencyController)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--recordset-delay', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='ghi kết quả ra file JSON')
+    parser.add_argument('--baseline', help='file JSON của lần chạy trước để so sánh')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--record', help='thư mục ghi cassette của từng kịch bản')
+    parser.add_argument('--replay', help='thư mục cassette để phát lại thay cho server giả lập')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='1 = thời gian gốc, 0 = không chờ')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenarios.split(','):
+        name = name.strip()
+        try:
+            results[name] = run_scenario(name, args)
+        except ImportError as e: # vd. combine cần scipy
+            print(f"Bỏ qua kịch bản {name}: {e}")
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.tolerance) else 0)
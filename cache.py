@@ -0,0 +1,340 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from expression import canonical_expression
+
+# các setting ảnh hưởng tới kết quả simulation (bỏ qua visualization, ...)
+CACHE_SETTINGS_KEYS = ['instrumentType', 'region', 'universe', 'delay', 'decay', 'neutralization',
+                       'truncation', 'pasteurization', 'unitHandling', 'nanHandling', 'language']
+
+
+def canonical_settings(settings: dict) -> str:
+    """Stable JSON for the settings that change a simulation's outcome."""
+    canonical = {}
+    for key in CACHE_SETTINGS_KEYS:
+        value = settings.get(key)
+        if isinstance(value, str):
+            value = value.upper()
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        canonical[key] = value
+    return json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+
+
+# score (before-and-after-performance) phụ thuộc pool alpha hiện tại: sau SCORE_TTL giây thì lấy lại
+SCORE_TTL = 24 * 3600
+SCORE_INDEX = -2  # vị trí score trong dòng của locate_alpha (simulation.RESULT_COLUMNS)
+
+
+def simulation_key(expression: str, settings: dict) -> str:
+    """Key of a simulation: the expression's canonical form (see expression.py) + canonical settings."""
+    raw = canonical_expression(expression) + '|' + canonical_settings(settings)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class SimulationCache:
+    """
+    Local SQLite store of simulation results keyed by expression + settings.
+
+    Rows are the lists returned by `WorldQuant.locate_alpha`, so a hit can be
+    written to the sheet exactly like a fresh result. The score in a row is
+    returned as None once it is older than `score_ttl` seconds, so callers
+    fetch it again (see `needs_enrichment`) and `update_result` refreshes it.
+    """
+
+    def __init__(self, path='./cache/simulations.sqlite', score_ttl=SCORE_TTL):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.score_ttl = score_ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS simulations ("
+                "key TEXT PRIMARY KEY, expression TEXT, settings TEXT, alpha_id TEXT, result TEXT, created REAL, "
+                "score_fetched REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS simulations_alpha_id ON simulations(alpha_id)")
+
+    def get(self, expression: str, settings: dict):
+        return self._fetch("SELECT result, score_fetched FROM simulations WHERE key = ?", simulation_key(expression, settings))
+
+    def get_by_alpha(self, alpha_id: str):
+        return self._fetch("SELECT result, score_fetched FROM simulations WHERE alpha_id = ?", alpha_id)
+
+    def put(self, expression: str, settings: dict, alpha_id: str, result: list) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO simulations (key, expression, settings, alpha_id, result, created, score_fetched) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (simulation_key(expression, settings), expression, canonical_settings(settings),
+                 alpha_id, json.dumps(result), time.time(), self._score_fetched(result))
+            )
+
+    def update_result(self, alpha_id: str, result: list) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE simulations SET result = ?, score_fetched = ? WHERE alpha_id = ?",
+                              (json.dumps(result), self._score_fetched(result), alpha_id))
+
+    @staticmethod
+    def _score_fetched(result):
+        return time.time() if len(result) >= -SCORE_INDEX and result[SCORE_INDEX] is not None else None
+
+    def settings_stats(self, column=1) -> dict:
+        """
+        (setting, canonical value) -> (count, mean) of result[`column`] (sharpe
+        by default) over every cached simulation, for ranking settings to try.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT settings, result FROM simulations").fetchall()
+        totals = {}
+        for settings, result in rows:
+            result = json.loads(result)
+            value = result[column] if len(result) > column else None
+            if not isinstance(value, (int, float)):
+                continue
+            for key, setting in json.loads(settings).items():
+                count, total = totals.get((key, json.dumps(setting)), (0, 0.0))
+                totals[(key, json.dumps(setting))] = (count + 1, total + value)
+        return {key: (count, total / count) for key, (count, total) in totals.items()}
+
+    def _fetch(self, query, value):
+        with self.lock:
+            row = self.conn.execute(query, (value,)).fetchone()
+        if row is None:
+            return None
+        result, score_fetched = json.loads(row[0]), row[1]
+        if len(result) >= -SCORE_INDEX and result[SCORE_INDEX] is not None:
+            if score_fetched is None or time.time() - score_fetched > self.score_ttl:
+                result[SCORE_INDEX] = None # score đã cũ: để caller lấy lại
+        return result
+
+
+class CatalogCache:
+    """
+    On-disk JSON cache of catalog listings (e.g. /data-fields pages).
+
+    One file per parameter set; entries older than the caller's TTL are
+    treated as missing.
+    """
+
+    def __init__(self, directory='./cache/datafields'):
+        self.directory = directory
+
+    def _path(self, params: dict) -> str:
+        raw = json.dumps(params, sort_keys=True, default=str)
+        return os.path.join(self.directory, hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32] + '.json')
+
+    def get(self, params: dict, ttl: float):
+        path = self._path(params)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('fetched', 0) > ttl:
+            return None
+        return entry['records']
+
+    def put(self, params: dict, records: list) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(params)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'fetched': time.time(), 'records': records}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class RecordsetStore:
+    """
+    Local store of alpha recordsets (pnl, turnover, ...).
+
+    Each (recordset name, alpha id) is one .npz file holding the alpha's
+    dates and float values, written once with an atomic rename. A put never
+    rewrites other alphas' data, and stores opened by different WorldQuant
+    instances or processes never overwrite each other, so a recordset is
+    fetched from the API at most once per alpha.
+
+    Alphas that combine already downloaded into `{legacy_directory}/{id}.csv`
+    (date, daily returns, turnover) are imported from there on first read
+    instead of being fetched again.
+    """
+
+    LEGACY_COLUMNS = {'pnl': 'returns', 'turnover': 'turnover'}
+
+    def __init__(self, directory='./cache/recordsets', legacy_directory='./combine/details'):
+        self.directory = directory
+        self.legacy_directory = legacy_directory
+        self.series = {}  # (name, alpha_id) -> Series đã đọc
+        self.lock = threading.Lock()
+
+    def _path(self, name, alpha_id):
+        return os.path.join(self.directory, name, f'{alpha_id}.npz')
+
+    def get(self, name: str, alpha_id: str):
+        """The alpha's values as a date-indexed Series (dates it doesn't cover dropped), or None."""
+        with self.lock:
+            series = self.series.get((name, alpha_id))
+        if series is not None:
+            return series
+        path = self._path(name, alpha_id)
+        if not os.path.exists(path):
+            return self._import_legacy(name, alpha_id)
+        with np.load(path) as data:
+            series = pd.Series(data['values'], index=data['dates'].astype(str), name=alpha_id).dropna()
+        with self.lock:
+            self.series[(name, alpha_id)] = series
+        return series
+
+    def put(self, name: str, alpha_id: str, records: list):
+        """Store `records` ([[date, value], ...]) for the alpha and return them as a Series."""
+        series = pd.Series([record[1] for record in records],
+                           index=[record[0] for record in records], name=alpha_id, dtype='float64')
+        self._write(name, alpha_id, series)
+        series = series.dropna()
+        with self.lock:
+            self.series[(name, alpha_id)] = series
+        return series
+
+    def _write(self, name, alpha_id, series):
+        path = self._path(name, alpha_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz'
+        np.savez(tmp_path, dates=np.array(series.index, dtype=str), values=series.to_numpy(dtype='float64'))
+        os.replace(tmp_path, path)
+
+    def _import_legacy(self, name, alpha_id):
+        column = self.LEGACY_COLUMNS.get(name)
+        if column is None or not self.legacy_directory:
+            return None
+        legacy_path = os.path.join(self.legacy_directory, f'{alpha_id}.csv')
+        if not os.path.exists(legacy_path):
+            return None
+        frame = pd.read_csv(legacy_path, dtype={'date': str})
+        if column not in frame.columns:
+            return None
+        series = pd.Series(frame[column].to_numpy(dtype='float64'), index=frame['date'], name=alpha_id)
+        if name == 'pnl':
+            series = series.cumsum() # file cũ lưu pnl theo ngày, store lưu pnl cộng dồn như API trả về
+        self._write(name, alpha_id, series)
+        series = series.dropna()
+        with self.lock:
+            self.series[(name, alpha_id)] = series
+        return series
+
+
+class JobJournal:
+    """
+    Durable state of every simulation payload: QUEUED, SUBMITTED (with the
+    progress URL), COMPLETE (with the alpha id), FAILED, TIMEOUT or
+    CANCELLED (never submitted because its caller stopped early).
+
+    Every transition is committed right away, so after a crash the next run
+    can re-attach to progress URLs that are still running, locate alphas that
+    finished unseen, and skip work already done. `delivered` marks payloads
+    whose result has been handed to the caller; `source` records which
+    pipeline queued a payload, so a run only resumes its own work.
+    """
+
+    def __init__(self, path='./cache/jobs.sqlite'):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "key TEXT PRIMARY KEY, sim_data TEXT, state TEXT, location TEXT, position INTEGER, "
+                "alpha_id TEXT, error TEXT, delivered INTEGER DEFAULT 0, updated REAL, source TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_location ON jobs(location)")
+
+    @staticmethod
+    def key(sim_data: dict) -> str:
+        return simulation_key(sim_data['regular'], sim_data['settings'])
+
+    def get(self, sim_data: dict):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT state, location, alpha_id, error, delivered FROM jobs WHERE key = ?", (self.key(sim_data),)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['state', 'location', 'alpha_id', 'error', 'delivered'], row))
+
+    def queued(self, sim_data_list: list, source=None) -> None:
+        """Record new payloads of `source`; payloads that failed, timed out or were cancelled before are queued again."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO jobs (key, sim_data, state, updated, source) VALUES (?, ?, 'QUEUED', ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = 'QUEUED', location = NULL, error = NULL, "
+                "delivered = 0, updated = excluded.updated, source = excluded.source "
+                "WHERE state IN ('FAILED', 'TIMEOUT', 'CANCELLED')",
+                [(self.key(sim_data), json.dumps(sim_data), now, source) for sim_data in sim_data_list]
+            )
+
+    def submitted(self, sim_data_list: list, location: str) -> None:
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = 'SUBMITTED', location = ?, position = ?, updated = ? WHERE key = ?",
+                [(location, position, now, self.key(sim_data)) for position, sim_data in enumerate(sim_data_list)]
+            )
+
+    def completed(self, sim_data: dict, alpha_id: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE jobs SET state = 'COMPLETE', alpha_id = ?, updated = ? WHERE key = ?",
+                              (alpha_id, time.time(), self.key(sim_data)))
+
+    def failed(self, sim_data_list: list, error, state='FAILED') -> None:
+        """Mark payloads FAILED, or TIMEOUT when the watchdog cancelled them."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = ?, error = ?, updated = ? WHERE key = ?",
+                [(state, None if error is None else str(error), now, self.key(sim_data)) for sim_data in sim_data_list]
+            )
+
+    def cancelled(self, sim_data_list: list) -> None:
+        """Mark queued payloads the caller stopped waiting for; they are not resumed later."""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = 'CANCELLED', updated = ? WHERE key = ? AND state = 'QUEUED'",
+                [(now, self.key(sim_data)) for sim_data in sim_data_list]
+            )
+
+    def delivered(self, sim_data: dict) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE jobs SET delivered = 1, updated = ? WHERE key = ?",
+                              (time.time(), self.key(sim_data)))
+
+    def by_location(self, location: str) -> list:
+        """Payloads submitted together under `location`, in submission order."""
+        with self.lock:
+            rows = self.conn.execute("SELECT sim_data FROM jobs WHERE location = ? ORDER BY position",
+                                     (location,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def pending(self, source=None) -> list:
+        """Payloads a crashed run of `source` left behind: queued, still running, or finished but never delivered."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT sim_data FROM jobs WHERE source IS ? AND (state IN ('QUEUED', 'SUBMITTED') "
+                "OR (state = 'COMPLETE' AND delivered = 0)) ORDER BY updated", (source,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
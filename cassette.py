@@ -0,0 +1,174 @@
+import base64
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from metrics import endpoint_of
+
+# header không lưu vào cassette (cookie đăng nhập)
+SKIPPED_HEADERS = {'set-cookie'}
+
+
+def request_key(method, url, body) -> str:
+    """Host-independent key of a request: method, path + query and a hash of the (canonical JSON) body."""
+    parsed = urlparse(url)
+    target = parsed.path + ('?' + parsed.query if parsed.query else '')
+    if body:
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True).encode('utf-8')
+        except ValueError:
+            pass
+        target += '#' + hashlib.sha256(body).hexdigest()[:16]
+    return f'{method} {target}'
+
+
+class Cassette:
+    """
+    Recorded HTTP traffic of a session, one JSON interaction per line.
+
+    In 'record' mode every response that passes through `CassetteAdapter` is
+    appended with its offset from the start of the session and its latency.
+    In 'replay' mode requests are answered from the file without touching the
+    network: identical requests (e.g. polls of one progress URL) get their
+    recorded responses in order, the last one repeating once they run out.
+    `speed` scales replay timing: 1 reproduces the recorded latency and
+    Retry-After, 10 runs ten times faster, 0 drops all waiting.
+
+    Start a replay with empty local caches, or cache hits will skip requests
+    the recording contains.
+    """
+
+    def __init__(self, path, mode='replay', speed=1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"mode must be 'record' or 'replay', got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.interactions = defaultdict(list)  # key -> các response đã ghi, theo thứ tự
+        self.by_endpoint = defaultdict(list)   # (method, endpoint) -> response, khi không khớp chính xác
+        self.replayed = defaultdict(int)       # key -> số lần đã phát lại
+        self.misses = 0
+
+        if mode == 'record':
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'cassette': 1, 'recorded': datetime.datetime.now().isoformat()}) + '\n')
+        else:
+            self._load()
+
+    @classmethod
+    def from_env(cls):
+        """Cassette configured by BRAIN_CASSETTE (path), BRAIN_CASSETTE_MODE and BRAIN_REPLAY_SPEED, or None."""
+        path = os.environ.get('BRAIN_CASSETTE')
+        if not path:
+            return None
+        return cls(path, os.environ.get('BRAIN_CASSETTE_MODE', 'replay'), float(os.environ.get('BRAIN_REPLAY_SPEED', 1)))
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if 'key' not in entry:
+                    continue
+                self.interactions[entry['key']].append(entry)
+                self.by_endpoint[(entry['method'], endpoint_of(entry['url']))].append(entry)
+        print(f"Cassette: {sum(len(v) for v in self.interactions.values())} response từ {self.path}")
+
+    def record(self, request, response, elapsed):
+        entry = {
+            'key': request_key(request.method, request.url, request.body),
+            't': round(time.monotonic() - self.started - elapsed, 6),
+            'elapsed': round(elapsed, 6),
+            'method': request.method,
+            'url': request.url,
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {key: value for key, value in response.headers.items() if key.lower() not in SKIPPED_HEADERS},
+        }
+        content = response.content or b''
+        try:
+            entry['body'] = content.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['body_b64'] = base64.b64encode(content).decode('ascii')
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def lookup(self, request):
+        """Recorded entry for `request`, or None."""
+        key = request_key(request.method, request.url, request.body)
+        with self.lock:
+            entries = self.interactions.get(key)
+            if entries:
+                index = min(self.replayed[key], len(entries) - 1)
+                self.replayed[key] += 1
+                return entries[index]
+            # không khớp chính xác (vd. thứ tự khác): dùng response cùng endpoint
+            self.misses += 1
+            similar = self.by_endpoint.get((request.method, endpoint_of(request.url)))
+            return similar[-1] if similar else None
+
+    def scaled(self, seconds):
+        if not self.speed:
+            return 0.0
+        return seconds / self.speed
+
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter that records real traffic into a `Cassette` or replays it offline."""
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        if self.cassette.mode == 'record':
+            started = time.monotonic()
+            response = super().send(request, **kwargs)
+            response.content # đọc hết body trước khi ghi
+            self.cassette.record(request, response, time.monotonic() - started)
+            return response
+        return self._replay(request)
+
+    def _replay(self, request):
+        entry = self.cassette.lookup(request)
+        response = Response()
+        response.request = request
+        response.url = request.url
+        if entry is None:
+            response.status_code = 404
+            response.reason = 'Not in cassette'
+            response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+            response._content = json.dumps({'detail': 'Not in cassette'}).encode('utf-8')
+            return response
+
+        time.sleep(self.cassette.scaled(entry['elapsed']))
+        headers = CaseInsensitiveDict(entry['headers'])
+        if 'Retry-After' in headers:
+            try:
+                headers['Retry-After'] = str(self.cassette.scaled(float(headers['Retry-After'])))
+            except ValueError:
+                pass
+        headers.pop('Content-Encoding', None) # body đã được giải nén khi ghi
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.headers = headers
+        response.encoding = 'utf-8'
+        if 'body_b64' in entry:
+            response._content = base64.b64decode(entry['body_b64'])
+        else:
+            response._content = entry['body'].encode('utf-8')
+        return response
@@ -10,6 +10,7 @@ import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 from worldquant import WorldQuant
+from result_sink import SheetWriter
 import json
 import gspread
 from itertools import product,combinations
@@ -34,6 +35,13 @@ class ComBine:
         
         self.main_database=pd.read_csv('./combine/main.csv')
         self.wl=WorldQuant()
+
+        #ghi kết quả ở background
+        self.combine_writer=SheetWriter(self.wks_combine)
+
+    def close(self):
+        """Ghi nốt các dòng còn trong bộ đệm."""
+        self.combine_writer.close()
     
     #xử lý data
     def procesing_data_alpha(self,data):
@@ -173,9 +181,8 @@ class ComBine:
                 #xuất kết quả
                 results=[code1,code2,str(weights),alpha,sharpe_max]+result_simulate
                 print(results)
-                self.wks_combine.append_rows([results])
+                self.combine_writer.append_row(results)
             except Exception as e:
-                self.wl=WorldQuant()
                 print('ERROR ', e)
                 continue
     def run(self,alpha,setting):
@@ -205,16 +212,17 @@ class ComBine:
                 #xuất kết quả
                 alpha_2=self.main_database[self.main_database['code']==code_2]['alpha'].values[0]
                 results=[self.date,alpha,alpha_2,str(weights),alpha_combine,sharpe_max]+result_simulate
-                self.wks_combine.append_rows([results])
+                self.combine_writer.append_row(results)
                 print(results)
                 
             except Exception as e:
-                self.wl=WorldQuant()
                 print('ERROR ', e)
                 continue
 
 
 if __name__=='__main__':
-    ComBine().run_v2()
+    combine=ComBine()
+    combine.run_v2()
+    combine.close()
     #a=ComBine().expression_combine(['0NRgx52','vpk6qza'],[0.5,0.5])
     #print(a)
\ No newline at end of file
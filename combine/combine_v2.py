@@ -10,6 +10,7 @@ import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 from worldquant import WorldQuant
+from result_sink import SheetWriter
 import json
 import gspread
 from itertools import product,combinations
@@ -27,6 +28,15 @@ class ComBine:
         self.main_database=pd.DataFrame(self.wks_main_combine.get_all_records())
         self.main_database=self.main_database[1:]
         self.wl=WorldQuant()
+
+        #ghi kết quả ở background
+        self.combine_writer=SheetWriter(self.wks_combine)
+        self.main_combine_writer=SheetWriter(self.wks_main_combine)
+    
+    def close(self):
+        """Ghi nốt các dòng còn trong bộ đệm."""
+        self.main_combine_writer.close()
+        self.combine_writer.close()
     
     
     def get_code(self,alpha: str,setting: str):
@@ -41,17 +51,15 @@ class ComBine:
             print('apha không có trong database')
             result_simulate=self.wl.single_simulate(alpha)
             
-            #lấy code và trích suất dữ liệu pl, turnover
+            #lấy code và tải trước pl, turnover vào recordset store
             print('get P&L') 
             code=result_simulate[-1]
-            pl=self.wl.get_pl(code)
-            turnover=self.wl.get_turnover(code)
-            data=pl.merge(turnover,how='inner',on=['date'])
+            self.wl.get_pl(code)
+            self.wl.get_turnover(code)
             
             #lưu dữ liệu
             print('save data')
-            data.to_csv(f'./combine/details/{code}.csv',index=False)
-            self.wks_main_combine.append_rows([[self.date,id,alpha,setting,code]])
+            self.main_combine_writer.append_row([self.date,id,alpha,setting,code])
             return code
 
     def commbine_sharpe(self,df_pl):
@@ -134,10 +142,10 @@ class ComBine:
         #chạy tổ hợp code
         for code_1,code_2 in map_codes:
             try:
-                pl_code1=pd.read_csv(f'./combine/details/{code_1}.csv')
+                pl_code1=self.wl.get_pl(code_1)
                 pl_code1=pl_code1[['date','returns']].iloc[:973] #chỉ lấy phần train
 
-                pl_code2=pd.read_csv(f'./combine/details/{code_2}.csv')
+                pl_code2=self.wl.get_pl(code_2)
                 pl_code2=pl_code2[['date','returns']].iloc[:973] #chỉ lấy phần train
 
                 pl=pl_code1.merge(pl_code2,how='inner',on=['date'])
@@ -154,9 +162,8 @@ class ComBine:
                 alpha_2=self.main_database[self.main_database['code']==code_2]['alpha'].values[0]
                 results=[self.date,alpha_1,alpha_2,str(weights),alpha,sharpe_max]+result_simulate
                 print(results)
-                self.wks_combine.append_rows([results])
+                self.combine_writer.append_row(results)
             except Exception as e:
-                self.wl=WorldQuant()
                 print('ERROR ', e)
                 continue
 
@@ -167,10 +174,10 @@ class ComBine:
         #chạy tổ hợp code
         for code_1,code_2 in maps:
             try:
-                pl_code_1=pd.read_csv(f'./combine/details/{code_1}.csv')
+                pl_code_1=self.wl.get_pl(code_1)
                 pl_code_1=pl_code_1[['date','returns']].iloc[:973] #chỉ lấy phần train
 
-                pl_code_2=pd.read_csv(f'./combine/details/{code_2}.csv')
+                pl_code_2=self.wl.get_pl(code_2)
                 pl_code_2=pl_code_2[['date','returns']].iloc[:973] #chỉ lấy phần train
 
                 pl=pl_code_1.merge(pl_code_2,how='inner',on=['date'])
@@ -187,16 +194,17 @@ class ComBine:
                 #xuất kết quả
                 alpha_2=self.main_database[self.main_database['code']==code_2]['alpha'].values[0]
                 results=[self.date,alpha,alpha_2,str(weights),alpha_combine,sharpe_max]+result_simulate
-                self.wks_combine.append_rows([results])
+                self.combine_writer.append_row(results)
                 print(results)
                 
             except Exception as e:
-                self.wl=WorldQuant()
                 print('ERROR ', e)
                 continue
 
 
 if __name__=='__main__':
-    ComBine().run_v2()
+    combine=ComBine()
+    combine.run_v2()
+    combine.close()
     #a=ComBine().expression_combine(['0NRgx52','vpk6qza'],[0.5,0.5])
     #print(a)
\ No newline at end of file
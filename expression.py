@@ -0,0 +1,205 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from lark import Lark
+from lark.exceptions import LarkError
+
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optimize', 'grammar.txt')
+
+BINARY_OPERATORS = {'add': ' + ', 'subtract': ' - ', 'multiply': ' * ', 'divide': ' / ',
+                    'less': ' < ', 'less_equal': ' <= ', 'greater': ' > ', 'greater_equal': ' >= ',
+                    'and': ' && '}
+
+# độ ưu tiên theo các tầng của grammar.txt; nút không có ở đây (hàm, biến, số, ...) là toán hạng
+PRECEDENCE = {'and': 1, 'less': 2, 'less_equal': 2, 'greater': 2, 'greater_equal': 2,
+              'add': 3, 'subtract': 3, 'multiply': 4, 'divide': 4, 'neg': 5}
+OPERAND = 6
+
+LEAVES = {'number', 'string', 'var'}
+CONSTANTS = {'true': 'true', 'false': 'false'}
+
+
+# chuỗi "..." (ESCAPED_STRING của grammar) hoặc một đoạn khoảng trắng
+WHITESPACE_OUTSIDE_STRINGS = re.compile(r'("(?:[^"\\]|\\.)*")|\s+')
+
+
+def normalize_expression(expression: str) -> str:
+    """Whitespace-insensitive form of a FASTEXPR expression; string literals are kept as written."""
+    return WHITESPACE_OUTSIDE_STRINGS.sub(lambda match: match.group(1) or '', expression)
+
+
+def expression_key(canonical: str) -> str:
+    """Dedup key of an expression already in canonical form (see ExpressionParser.canonical)."""
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def to_expr(tree) -> str:
+    """
+    FASTEXPR text of a parse tree (see optimize/grammar.txt), with parentheses
+    only where precedence or left-associativity needs them, so
+    parse(to_expr(tree)) == tree and to_expr(parse(to_expr(tree))) is stable.
+
+    Iterative: text pieces are pushed on a stack and joined once, so deep
+    trees neither recurse nor rebuild the strings of their subtrees.
+    """
+    pieces = []
+    stack = [tree]
+    emit = pieces.append
+    push = stack.append
+    precedence_of = PRECEDENCE.get
+    while stack:
+        node = stack.pop()
+        # phần tử đầu tiên của mỗi nút được xử lý ngay, không qua stack
+        while True:
+            if isinstance(node, str):  # Token hoặc đoạn text dựng sẵn
+                emit(node)
+                break
+
+            data = node.data
+            children = node.children
+            if data in LEAVES:
+                emit(children[0])
+                break
+
+            if data in BINARY_OPERATORS:
+                # stack là LIFO: đẩy vế phải trước
+                left, right = children
+                precedence = PRECEDENCE[data]
+                right_data = getattr(right, 'data', None)
+                if precedence_of(right_data, OPERAND) <= precedence:  # a - (b - c)
+                    push(')')
+                    push(right)
+                    push('(')
+                else:
+                    push(right.children[0] if right_data in LEAVES else right)
+                push(BINARY_OPERATORS[data])
+                left_data = getattr(left, 'data', None)
+                if left_data in LEAVES:
+                    emit(left.children[0])
+                    break
+                node = left
+                if precedence_of(left_data, OPERAND) < precedence:
+                    emit('(')
+                    push(')')
+            elif data == 'func_call':
+                emit(children[0])
+                emit('(')
+                push(')')
+                node = children[1]
+            elif data == 'arg_list':
+                for index in range(len(children) - 1, 0, -1):
+                    child = children[index]
+                    push(child.children[0] if getattr(child, 'data', None) in LEAVES else child)
+                    push(', ')
+                node = children[0]
+                if node is None:  # f() -> arg_list [None]
+                    break
+            elif data == 'neg':
+                node = children[0]
+                child_data = getattr(node, 'data', None)
+                emit('-')
+                # -(5): "-5" sẽ được parse thành số âm chứ không phải neg
+                if child_data == 'number' or precedence_of(child_data, OPERAND) < OPERAND:
+                    emit('(')
+                    push(')')
+            elif data == 'kwarg':
+                emit(children[0])
+                emit('=')
+                node = children[1]
+            elif data in CONSTANTS:
+                emit(CONSTANTS[data])
+                break
+            else:
+                raise ValueError(f"Cannot serialize {data!r} node")
+    return ''.join(pieces)
+
+
+class ExpressionParser:
+    """
+    FASTEXPR parser with a bounded LRU cache of parse trees.
+
+    Trees are looked up by whitespace-insensitive expression text and by their
+    canonical form (`canonical`: the tree serialized back with `to_expr`), so
+    a variant produced by serializing a transformed tree is never parsed
+    again once it is `remember`ed. Cached trees are shared: transform them
+    (lark Transformers build new trees), never edit them in place.
+
+    `key` hashes the canonical form, a stable id for deduplicating
+    expressions that differ only in spacing or redundant parentheses.
+    """
+
+    def __init__(self, grammar_path=GRAMMAR_PATH, maxsize=4096):
+        with open(grammar_path, 'r', encoding='utf-8') as f:
+            self.grammar = f.read()
+        self.parser = Lark(self.grammar, parser='lalr')
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # text đã bỏ khoảng trắng -> (tree, canonical)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, expression: str):
+        return self._entry(expression)[0]
+
+    def canonical(self, expression: str) -> str:
+        return self._entry(expression)[1]
+
+    def key(self, expression: str) -> str:
+        return expression_key(self.canonical(expression))
+
+    def remember(self, tree) -> str:
+        """Cache an already-built tree under its canonical form; returns that form."""
+        canonical = to_expr(tree)
+        with self.lock:
+            self._store(normalize_expression(canonical), (tree, canonical))
+        return canonical
+
+    def _entry(self, expression):
+        text = normalize_expression(expression)
+        with self.lock:
+            entry = self.entries.get(text)
+            if entry is not None:
+                self.entries.move_to_end(text)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        tree = self.parser.parse(expression) # ngoài lock: các luồng parse song song được
+        entry = (tree, to_expr(tree))
+        with self.lock:
+            self._store(text, entry)
+            self._store(normalize_expression(entry[1]), entry)
+        return entry
+
+    def _store(self, text, entry):
+        self.entries[text] = entry
+        self.entries.move_to_end(text)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def info(self) -> dict:
+        with self.lock:
+            return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+_default_parser = None
+_default_parser_lock = threading.Lock()
+
+
+def default_parser() -> ExpressionParser:
+    """The process-wide ExpressionParser shared by simulation keys and Optimize."""
+    global _default_parser
+    with _default_parser_lock:
+        if _default_parser is None:
+            _default_parser = ExpressionParser(maxsize=50000)
+        return _default_parser
+
+
+def canonical_expression(expression: str) -> str:
+    """Canonical form of `expression`, or its whitespace-normalized text if it does not parse."""
+    try:
+        return default_parser().canonical(expression)
+    except LarkError:
+        return normalize_expression(expression)
@@ -20,7 +20,7 @@ import gspread
 from time import sleep
 from worldquant import WorldQuant
 #from optimize.optimize_v2 import Optimize 
-import csv
+from result_sink import SheetWriter
 from combine.combine_v2 import ComBine
 import random
 
@@ -81,9 +81,11 @@ class GenAI:
         gc = gspread.service_account(filename='./apisheet.json')
         wks = gc.open("Auto Alpha").worksheet("auto_alpha_v2")
         self.wks=wks
+        self.writer=SheetWriter(wks) #ghi sheet ở background, lỗi quota thì thử lại, dòng chưa ghi nằm trong journal
 
         group_wks = gc.open("Auto Alpha").worksheet("group_hypothesis")
         self.group_wks=group_wks
+        self.group_writer=SheetWriter(group_wks)
 
         '''
         #dữ liệu lịch sử phản hồi
@@ -104,13 +106,7 @@ class GenAI:
         return data
     
     def append_rows(self,result_simulate):
-        try:
-            self.wks.append_rows(result_simulate)
-        except Exception as e:
-            with open('./results.csv', mode='a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerows(result_simulate)
-            print(f'ERROR GG SHEET {e}')
+        self.writer.append_rows(result_simulate)
 
     def contents_prompt(self,file_path,df,prompt):
         if file_path:
@@ -241,7 +237,7 @@ class GenAI:
 
         #create group hypothesis
         df_group_hypothesis=self.genai_group_hypothesis(file_pdf_path,df_sub_hypothesis)
-        self.group_wks.append_rows(df_group_hypothesis.values.tolist())
+        self.group_writer.append_rows(df_group_hypothesis.values.tolist())
         #in kết quả
         json_text=df_group_hypothesis.to_json(orient="records", force_ascii=False, indent=2)
         print('Group Hypothesis\n',json_text)
@@ -285,7 +281,9 @@ class GenAI:
                             print('Combine Alpha')
                             alpha=results[7]
                             setting=results[16]
-                            ComBine().run(alpha,setting)
+                            combine=ComBine()
+                            combine.run(alpha,setting)
+                            combine.close() #ghi nốt kết quả combine
                         
                         #chạy similar
                         if check_simulate and score and score >0: #kiểm tra đồng thời tồn tại kết quả simulate,score và score >0
@@ -317,7 +315,9 @@ class GenAI:
                                    print('Combine Alpha')
                                    alpha=results[7]
                                    setting=results[16]
-                                   ComBine().run(alpha,setting)
+                                   combine=ComBine()
+                                   combine.run(alpha,setting)
+                                   combine.close() #ghi nốt kết quả combine
                     else:
                         results=[self.date, self.process_name, file_name]+df_alpha.values.tolist()[0]
                         self.append_rows([results])
@@ -325,6 +325,8 @@ class GenAI:
             except Exception as e:
                 print(f'ERROR {e}')
                 sleep(30)
+        self.writer.flush() #chờ ghi hết kết quả lên sheet
+        self.group_writer.flush()
 
     def processing_simulate(self,expression_alpha:str,df_alpha,file_name):
         result_simulate=wl.single_simulate(expression_alpha)
@@ -20,7 +20,7 @@ import datetime
 import gspread
 from time import sleep
 from worldquant import WorldQuant
-import csv
+from result_sink import SheetWriter
 import random
 
 class genai_alpha_format(BaseModel):
@@ -58,6 +58,7 @@ class GenAI:
         gc = gspread.service_account(filename='./apisheet.json')
         wks = gc.open("Auto Alpha").worksheet("auto_alpha")
         self.wks=wks
+        self.writer=SheetWriter(wks) #ghi sheet ở background, lỗi quota thì thử lại, dòng chưa ghi nằm trong journal
 
         '''#dữ liệu lịch sử phản hồi
         response_history=wks.get_all_records()
@@ -74,13 +75,7 @@ class GenAI:
         return data
     
     def append_rows(self,result_simulate):
-        try:
-            self.wks.append_rows(result_simulate)
-        except Exception as e:
-            with open('./results.csv', mode='a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerows(result_simulate)
-            print(f'ERROR GG SHEET {e}')
+        self.writer.append_rows(result_simulate)
 
     def contents_prompt(self,file_path,df,prompt):
         if file_path:
@@ -212,6 +207,7 @@ class GenAI:
             except Exception as e:
                 print(f'ERROR RUN {e}')
                 sleep(30)
+        self.writer.flush() #chờ ghi hết kết quả lên sheet
 
 if __name__ == '__main__':
     '''sub_index_key=int(input('Nhập sub_index_key (int): '))
@@ -16,7 +16,7 @@ import datetime
 import gspread
 from time import sleep
 from worldquant import WorldQuant
-import csv
+from result_sink import SheetWriter
 import random
 import PyPDF2
 
@@ -50,6 +50,7 @@ class GenAI:
         gc = gspread.service_account(filename='./apisheet.json')
         wks = gc.open("Plan - stage 3").worksheet("financial_ratios")
         self.wks=wks
+        self.writer=SheetWriter(wks) #ghi sheet ở background, lỗi quota thì thử lại, dòng chưa ghi nằm trong journal
 
     # Đọc file JSON
     def read_json(self,file_path):
@@ -58,13 +59,7 @@ class GenAI:
         return data
     
     def append_rows(self,result_simulate):
-        try:
-            self.wks.append_rows(result_simulate)
-        except Exception as e:
-            with open('./results.csv', mode='a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerows(result_simulate)
-            print(f'ERROR GG SHEET {e}')
+        self.writer.append_rows(result_simulate)
     
     def contents_prompt(self,file_path,df,prompt):
         if file_path:
@@ -159,8 +154,9 @@ class GenAI:
                 #chạy mô phỏng
                 simulate_result = wq.single_simulate(formula)
                 print(result)
-                self.wks.append_rows([[None]+result.values.tolist()[0]+[None]])
+                self.append_rows([[None]+result.values.tolist()[0]+[None]])
                 sleep(30)
+        self.writer.flush() #chờ ghi hết kết quả lên sheet
     
 if __name__ == '__main__':
     variable=input("Hãy chọn môt biến: ")
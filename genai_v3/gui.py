@@ -771,7 +771,18 @@ class AlphaFindingTool:
                     return
                 
                 # GIỐNG Y CHANG LOGIC CODE CŨ
-                self.new_alphas = Optimize().complete_search(alpha, option_items)
+                # sinh dần: hiển thị ngay các biến thể đầu tiên, cập nhật khi số lượng tăng gấp đôi
+                variants = []
+                next_refresh = 1
+                for variant in Optimize().iter_search(alpha, option_items, processes=os.cpu_count()):
+                    variants.append(variant)
+                    if len(variants) >= next_refresh:
+                        next_refresh *= 2
+                        self.new_alphas = list(variants)
+                        self.root.after(0, self.display_alphas)
+                        self.root.after(0, lambda n=len(variants): self.progress_label.config(
+                            text=f"Generating alpha variations... {n}"))
+                self.new_alphas = variants
                 self.root.after(0, self.display_alphas)
                 
                 # GIỐNG CODE CŨ - Print statements
@@ -803,7 +814,7 @@ class AlphaFindingTool:
         
         def enter_simulate():
             try:
-                self.wq.simulate(self.new_alphas)  # GIỐNG CODE CŨ
+                self.wq.simulate(self.new_alphas, priority='interactive', source='gui')  # GIỐNG CODE CŨ
                 
                 # Switch to simulation tab - GIỐNG CODE CŨ
                 self.root.after(0, lambda: self.notebook.select(2))  # GIỐNG CODE CŨ
@@ -984,7 +984,7 @@ class AlphaFindingTool:
                     f"Simulating alpha {idx+1}/{total}: {a[:30]}..."))
                             
                 try:
-                    self.wq.simulate([alpha])
+                    self.wq.simulate([alpha], priority='interactive', source='gui')
                     self.root.after(0, lambda v=i+1: self.simulation_progress.config(value=v))
                     time.sleep(0.5)
                                 
@@ -1251,7 +1251,18 @@ class AlphaFindingTool:
                     return
                 
                 # Generate variations
-                self.new_alphas = Optimize().complete_search(alpha, option_items)
+                # sinh dần: hiển thị ngay các biến thể đầu tiên, cập nhật khi số lượng tăng gấp đôi
+                variants = []
+                next_refresh = 1
+                for variant in Optimize().iter_search(alpha, option_items, processes=os.cpu_count()):
+                    variants.append(variant)
+                    if len(variants) >= next_refresh:
+                        next_refresh *= 2
+                        self.new_alphas = list(variants)
+                        self.root.after(0, self.display_alphas)
+                        self.root.after(0, lambda n=len(variants): self.progress_label.config(
+                            text=f"Generating alpha variations... {n}"))
+                self.new_alphas = variants
                 self.root.after(0, self.display_alphas)
                 
                 # Print statements for debugging
@@ -970,43 +970,36 @@ class AlphaFindingTool:
     def run_simulation(self):
         """Run actual simulation với progress updates"""
         try:
-            batch_size = 3
             total = len(self.selected_alphas)
-
-            for i in range(0, total, batch_size):
-
-                while self.simulation_paused and self.simulation_running:
-                    time.sleep(3)
-
-                if not self.simulation_running:
-                    self.root.after(0, lambda: self.update_simulation_progress("Simulation stopped by user."))
-                    break
-
-                # Lấy batch 3 alpha
-                batch = self.selected_alphas[i:i+batch_size]
-
-                self.current_simulation_index = i
-
-                self.root.after(
-                    0,
-                    lambda idx=i, total=total, b=batch: self.update_simulation_progress(
-                        f"Simulating alphas {idx+1}-{min(idx+batch_size, total)}/{total}: {[a[:15]+'...' for a in b]}"
+            done = 0
+            # mọi alpha đi qua executor một lần: slot trống được lấp ngay, không chờ cả batch xong
+            records = self.wq.simulate_iter(self.selected_alphas, priority='interactive', source='gui')
+            try:
+                for record in records:
+                    done += 1
+                    self.current_simulation_index = min(done, total - 1)
+                    self.root.after(
+                        0,
+                        lambda v=done, r=record: (
+                            self.simulation_progress.config(value=v),
+                            self.update_simulation_progress(
+                                f"Simulated {v}/{total}: {r['expression'][:15]}... ({r['status']})"
+                            )
+                        )
                     )
-                )
 
-                try:
-                    # simulate nhiều alpha cùng lúc
-                    self.wq.simulate(batch)
+                    # tạm dừng: không lấy record tiếp thì executor cũng không gửi thêm simulation
+                    while self.simulation_paused and self.simulation_running:
+                        time.sleep(3)
 
-                    # update progress (tăng theo số alpha trong batch)
-                    self.root.after(0, lambda v=min(i+batch_size, total): self.simulation_progress.config(value=v))
-                    time.sleep(0.5)
-
-                except Exception as e:
-                    print(f"Error simulating batch starting at {i+1}: {e}")
-                    continue
+                    if not self.simulation_running:
+                        self.root.after(0, lambda: self.update_simulation_progress("Simulation stopped by user."))
+                        break
+            finally:
+                records.close() # dừng sớm: các alpha chưa gửi bị huỷ
 
             if self.simulation_running:
+                self.wq.enrichment.join() # chờ điền xong score như simulate
                 self.root.after(0, self.simulation_completed)
             else:
                 self.root.after(0, self.reset_simulation_ui)
@@ -1266,7 +1259,18 @@ class AlphaFindingTool:
                     return
                 
                 # Generate variations
-                self.new_alphas = Optimize().complete_search(alpha, option_items)
+                # sinh dần: hiển thị ngay các biến thể đầu tiên, cập nhật khi số lượng tăng gấp đôi
+                variants = []
+                next_refresh = 1
+                for variant in Optimize().iter_search(alpha, option_items, processes=os.cpu_count()):
+                    variants.append(variant)
+                    if len(variants) >= next_refresh:
+                        next_refresh *= 2
+                        self.new_alphas = list(variants)
+                        self.root.after(0, self.display_alphas)
+                        self.root.after(0, lambda n=len(variants): self.progress_label.config(
+                            text=f"Generating alpha variations... {n}"))
+                self.new_alphas = variants
                 self.root.after(0, self.display_alphas)
                 
                 # Print statements for debugging
@@ -1789,7 +1789,7 @@ class AlphaFindingTool:
 
                 try:
                     # simulate nhiều alpha cùng lúc
-                    self.wq.simulate(batch)
+                    self.wq.simulate(batch, priority='interactive', source='gui')
 
                     # update progress (tăng theo số alpha trong batch)
                     self.root.after(0, lambda v=min(i+batch_size, total): self.simulation_progress.config(value=v))
@@ -2059,7 +2059,18 @@ class AlphaFindingTool:
                     return
                 
                 # Generate variations
-                self.new_alphas = Optimize().complete_search(alpha, option_items)
+                # sinh dần: hiển thị ngay các biến thể đầu tiên, cập nhật khi số lượng tăng gấp đôi
+                variants = []
+                next_refresh = 1
+                for variant in Optimize().iter_search(alpha, option_items, processes=os.cpu_count()):
+                    variants.append(variant)
+                    if len(variants) >= next_refresh:
+                        next_refresh *= 2
+                        self.new_alphas = list(variants)
+                        self.root.after(0, self.display_alphas)
+                        self.root.after(0, lambda n=len(variants): self.progress_label.config(
+                            text=f"Generating alpha variations... {n}"))
+                self.new_alphas = variants
                 self.root.after(0, self.display_alphas)
                 
                 # Print statements for debugging
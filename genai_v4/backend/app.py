@@ -1,5 +1,6 @@
 # backend/app.py
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import optimizer # Import module optimizer đã được sửa
 import worldquant as wq # QUAN TRỌNG: Import file worldquant.py gốc của bạn
@@ -30,8 +31,16 @@ def run_exhaustive_search():
     if not base_alpha:
         return jsonify({"error": "Cần nhập biểu thức alpha gốc!"}), 400
 
+    limit = data.get('limit', 500)
+    if data.get('stream'):
+        # trả từng alpha một dòng JSON ngay khi sinh ra, để giao diện hiển thị dần
+        def lines():
+            for alpha in optimizer.iter_exhaustive_search(base_alpha, options, limit):
+                yield json.dumps({"alpha": alpha}, ensure_ascii=False) + "\n"
+        return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
     # Gọi hàm exhaustive_search đã được cập nhật
-    generated_alphas = optimizer.exhaustive_search(base_alpha, options)
+    generated_alphas = optimizer.exhaustive_search(base_alpha, options, limit)
 
     return jsonify({"generated_alphas": generated_alphas})
 
@@ -19,6 +19,8 @@ try:
     # Đọc file CSV bằng đường dẫn đầy đủ
     fields_df = pd.read_csv(fields_csv_path)
     operators_df = pd.read_csv(operators_csv_path)
+    if 'operator' not in operators_df.columns and 'name' in operators_df.columns: # operators.csv dùng cột 'name'
+        operators_df = operators_df.rename(columns={'name': 'operator'})
     print("Đã đọc thành công fields.csv và operator.csv bằng đường dẫn tuyệt đối.")
 except FileNotFoundError:
     print(f"CẢNH BÁO: Không tìm thấy file fields.csv hoặc operator.csv tại '{parent_dir}'.")
@@ -75,11 +77,13 @@ def generate_replacements(options, fields, operators, numbers):
             
     return replacement_map
 
-def exhaustive_search(alpha_expression, options):
+def iter_exhaustive_search(alpha_expression, options, limit=500):
+    """Sinh lần lượt các biến thể không trùng lặp, dừng sau `limit` biến thể (không dựng hết tích Descartes)."""
     fields, operators, numbers, components = extract(alpha_expression)
     
     if not any(options.values()):
-        return [alpha_expression]
+        yield alpha_expression
+        return
 
     replacement_map = generate_replacements(options, fields, operators, numbers)
     
@@ -89,6 +93,12 @@ def exhaustive_search(alpha_expression, options):
     
     for combination in product(*component_options):
         new_alpha = "".join(combination)
+        if new_alpha in generated_alphas:
+            continue
         generated_alphas.add(new_alpha)
+        yield new_alpha
+        if limit and len(generated_alphas) >= limit:
+            return
 
-    return list(generated_alphas)[:500]
\ No newline at end of file
+def exhaustive_search(alpha_expression, options, limit=500):
+    return list(iter_exhaustive_search(alpha_expression, options, limit))
@@ -92,14 +92,40 @@ document.getElementById('search-btn').addEventListener('click', async () => {
 
     if (!Object.values(options).some(v => v)) return alert("Vui lòng chọn ít nhất một tùy chọn vét cạn.");
 
-    showLoading("Đang vét cạn các biểu thức...");
-    const data = await apiCall('/exhaustive-search', { alpha: baseAlpha, options });
-    hideLoading();
-    
-    if (data && data.generated_alphas) {
-        const resultTextArea = document.getElementById('search-result');
-        resultTextArea.value = data.generated_alphas.join('\n');
-        document.getElementById('alpha-count').textContent = data.generated_alphas.length;
+    // nhận kết quả dạng stream (mỗi dòng một alpha) và hiển thị ngay khi có
+    const resultTextArea = document.getElementById('search-result');
+    const alphaCount = document.getElementById('alpha-count');
+    const alphas = [];
+    resultTextArea.value = '';
+    alphaCount.textContent = 0;
+    try {
+        const response = await fetch(`${API_BASE_URL}/exhaustive-search`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ alpha: baseAlpha, options, stream: true })
+        });
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.error || `Lỗi HTTP: ${response.status}`);
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (line.trim()) alphas.push(JSON.parse(line).alpha);
+            }
+            resultTextArea.value = alphas.join('\n');
+            alphaCount.textContent = alphas.length;
+        }
+    } catch (error) {
+        console.error('API Call Error (/exhaustive-search):', error);
+        alert(`Đã xảy ra lỗi: ${error.message}`);
     }
 });
 
@@ -0,0 +1,202 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+# giới hạn trên (giây) của các bucket histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, math.inf)
+
+# url -> endpoint dạng mẫu, để id của alpha/simulation không làm nổ số nhãn
+ENDPOINT_PATTERNS = [
+    (re.compile(r'^/simulations/?$'), '/simulations'),
+    (re.compile(r'^/simulations/[^/]+$'), '/simulations/{id}'),
+    (re.compile(r'^/alphas/[^/]+$'), '/alphas/{id}'),
+    (re.compile(r'^/alphas/[^/]+/recordsets/([^/]+)$'), r'/alphas/{id}/recordsets/\1'),
+    (re.compile(r'^/alphas/[^/]+/correlations/([^/]+)$'), r'/alphas/{id}/correlations/\1'),
+    (re.compile(r'^/competitions/([^/]+)/alphas/[^/]+/([^/]+)$'), r'/competitions/\1/alphas/{id}/\2'),
+]
+
+
+def endpoint_of(url: str) -> str:
+    """Endpoint template for a Brain API URL, e.g. '/alphas/{id}/recordsets/pnl'."""
+    path = urlparse(url).path.rstrip('/') or '/'
+    for pattern, template in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return pattern.sub(template, path)
+    return path
+
+
+class Histogram:
+    """Cumulative-bucket histogram plus a window of recent samples for quantiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=2048):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """
+    In-process instrumentation of the Brain API client.
+
+    Per endpoint (see `endpoint_of`): request counts, latency histograms,
+    status-code counts, transport errors and retries. Per simulation phase:
+    `wait` (queued locally for a slot), `queue` (accepted until the server
+    reports it running), `run` (running until complete), `total` and
+    `enrichment` durations; `wait` is also split by priority class
+    (`wait_interactive`, `wait_followup`, `wait_bulk`).
+
+    `snapshot()` returns a plain dict; `to_prometheus()` / `to_json()` (or
+    `write(path)`) dump it for scraping or offline comparison.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}   # (endpoint, method) -> số request
+            self.statuses = {}   # (endpoint, status) -> số response
+            self.errors = {}     # (endpoint, loại lỗi) -> số lần
+            self.retries = {}    # (endpoint, lý do) -> số lần
+            self.latency = {}    # endpoint -> Histogram
+            self.phases = {}     # phase -> Histogram
+
+    def response_hook(self, response, *args, **kwargs):
+        """`requests` response hook: count the request and its latency (time to response headers)."""
+        request = response.request
+        self.observe_request(request.url, request.method, response.status_code, response.elapsed.total_seconds())
+        return response
+
+    def observe_request(self, url, method, status, seconds):
+        endpoint = endpoint_of(url)
+        with self.lock:
+            self._inc(self.requests, (endpoint, method))
+            self._inc(self.statuses, (endpoint, str(status)))
+            self.latency.setdefault(endpoint, Histogram()).observe(seconds)
+
+    def observe_error(self, url, method, error):
+        """A request that raised before any response (timeout, connection reset, ...)."""
+        endpoint = endpoint_of(url)
+        with self.lock:
+            self._inc(self.requests, (endpoint, method))
+            self._inc(self.errors, (endpoint, type(error).__name__))
+
+    def retry(self, url, reason):
+        with self.lock:
+            self._inc(self.retries, (endpoint_of(url), reason))
+
+    def observe_phase(self, phase, seconds):
+        if seconds is None:
+            return
+        with self.lock:
+            self.phases.setdefault(phase, Histogram()).observe(max(0.0, seconds))
+
+    @staticmethod
+    def _inc(counter, key, value=1):
+        counter[key] = counter.get(key, 0) + value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            endpoints = {}
+            for (endpoint, method), count in self.requests.items():
+                entry = endpoints.setdefault(endpoint, {'requests': {}, 'statuses': {}, 'errors': {}, 'retries': {}})
+                entry['requests'][method] = count
+            for key, name in ((self.statuses, 'statuses'), (self.errors, 'errors'), (self.retries, 'retries')):
+                for (endpoint, label), count in key.items():
+                    entry = endpoints.setdefault(endpoint, {'requests': {}, 'statuses': {}, 'errors': {}, 'retries': {}})
+                    entry[name][label] = count
+            for endpoint, histogram in self.latency.items():
+                endpoints[endpoint]['latency'] = histogram.snapshot()
+            return {
+                'endpoints': endpoints,
+                'phases': {phase: histogram.snapshot() for phase, histogram in self.phases.items()},
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix='brain') -> str:
+        def labels(**values):
+            return '{' + ','.join(f'{key}="{value}"' for key, value in values.items()) + '}'
+
+        def bound(value):
+            return '+Inf' if value == math.inf else repr(float(value))
+
+        lines = []
+        with self.lock:
+            counters = [
+                ('requests_total', 'Requests sent, by endpoint and method.', self.requests, ('endpoint', 'method')),
+                ('responses_total', 'Responses received, by endpoint and status code.', self.statuses, ('endpoint', 'status')),
+                ('request_errors_total', 'Requests that raised before a response.', self.errors, ('endpoint', 'error')),
+                ('retries_total', 'Requests repeated, by endpoint and reason.', self.retries, ('endpoint', 'reason')),
+            ]
+            for name, help_text, counter, label_names in counters:
+                lines.append(f'# HELP {prefix}_{name} {help_text}')
+                lines.append(f'# TYPE {prefix}_{name} counter')
+                for key, count in sorted(counter.items()):
+                    lines.append(f'{prefix}_{name}{labels(**dict(zip(label_names, key)))} {count}')
+
+            histograms = [
+                ('request_seconds', 'Request latency to response headers.', self.latency, 'endpoint'),
+                ('simulation_phase_seconds', 'Simulation wait/queue/run/total and enrichment durations.', self.phases, 'phase'),
+            ]
+            for name, help_text, family, label_name in histograms:
+                lines.append(f'# HELP {prefix}_{name} {help_text}')
+                lines.append(f'# TYPE {prefix}_{name} histogram')
+                for key, histogram in sorted(family.items()):
+                    for upper, count in histogram.cumulative():
+                        lines.append(f'{prefix}_{name}_bucket{labels(**{label_name: key, "le": bound(upper)})} {count}')
+                    lines.append(f'{prefix}_{name}_sum{labels(**{label_name: key})} {histogram.sum}')
+                    lines.append(f'{prefix}_{name}_count{labels(**{label_name: key})} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path) -> None:
+        """Dump to `path`: Prometheus text for *.prom / *.txt, JSON otherwise."""
+        text = self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
@@ -6,7 +6,7 @@ parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
-from lark import Lark, Transformer, v_args
+from lark import Transformer, v_args
 from lark import Transformer, Tree, Token
 
 import gspread
@@ -15,7 +15,14 @@ import ast
 import json
 from itertools import product
 from worldquant import WorldQuant
+from result_sink import AsyncWriter, CsvSink, SheetWriter
+from simulation import RESULT_COLUMNS
+from expression import default_parser, expression_key, to_expr
 import random
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 class RenameFields(Transformer):
     def __init__(self, rename_map):
@@ -59,32 +66,79 @@ class RenameOperators(Transformer):
 
         return Tree("func_call", [func_name, args])
     
+class RankIndex:
+    '''
+    Chỉ mục xếp hạng dựng một lần khi load: id -> group và group -> tuple các id
+    sắp theo rank giảm dần (cùng thứ tự như sort trên DataFrame của group đó).
+    '''
+    def __init__(self,df,key):
+        self.group_of={}
+        for item,group in zip(df[key],df['group']):
+            self.group_of.setdefault(item,group) #id trùng: lấy group của dòng đầu tiên
+        self.members={}
+        for group,df_group in df.groupby('group',sort=False):
+            self.members[group]=tuple(df_group.sort_values(by='rank',ascending=False)[key])
+        self.others={} #id -> các id khác cùng group, tính lần đầu được hỏi
+
+    def similar(self,item):
+        '''
+        Các id cùng group với item (bỏ item), rank cao trước; () nếu item không có trong bảng.
+        '''
+        others=self.others.get(item)
+        if others is None:
+            members=list(self.members.get(self.group_of.get(item),()))
+            if item in members:
+                members.remove(item) #xóa phần tử đầu vào ra khỏi danh sách
+            others=self.others[item]=tuple(members)
+        return others
+
 class Optimize:
     def __init__(self):
         #self.similar_fields=self.read_json('./optimize/similar_fields.json')
         #self.operator=self.read_json('./optimize/operator.json')
         self.df_rank_fields=pd.read_csv('./optimize/rank/fields.csv')
         self.df_rank_operators=pd.read_csv('./optimize/rank/operators.csv')
+        #chỉ mục group / rank để tra cứu thay thế không phải lọc DataFrame mỗi lần
+        self.rank_fields=RankIndex(self.df_rank_fields,'id')
+        self.rank_operators=RankIndex(self.df_rank_operators,'name')
         self.days=['25','63','125','250','500']
         self.groups=['market','sector','industry','subindustry']
         
-        self.grammar = open("./optimize/grammar.txt", "r", encoding="utf-8").read()
-        self.parser = Lark(self.grammar, parser='lalr')
+        #parser có cache cây cú pháp (LRU) theo công thức và dạng chuẩn của công thức,
+        #dùng chung với simulation_key nên biến thể sinh ra không phải parse lại khi simulate
+        self.expressions = default_parser()
+        self.grammar = self.expressions.grammar
+        self.parser = self.expressions.parser
 
         #self.wl=WorldQuant()
         #gc = gspread.service_account(filename='./apisheet.json')
         #wks = gc.open("Auto Alpha").worksheet("optimize")
         #self.wks=wks
     
+    @property
+    def sheet_writer(self):
+        #ghi kết quả lên sheet theo lô ở background thay vì mỗi alpha một request
+        if not hasattr(self,'_sheet_writer'):
+            self._sheet_writer=SheetWriter(self.wks)
+        return self._sheet_writer
+    
     # Đọc file JSON
     def read_json(self,file_path):
         with open(file_path, 'r', encoding='utf-8') as file:
             data = json.load(file)  # Tải dữ liệu JSON
         return data
 
+    def parse(self,alpha):
+        #cây cú pháp dùng chung từ cache, không sửa trực tiếp
+        return self.expressions.parse(alpha)
+
+    def canonical(self,alpha):
+        #dạng chuẩn của công thức (bỏ khác biệt khoảng trắng / ngoặc), dùng làm key để loại trùng
+        return self.expressions.canonical(alpha)
+
     #xuất hàm và biến
     def extract(self,alpha):
-        tree = self.parser.parse(alpha)
+        tree = self.parse(alpha)
         filed_list = []
         operator_list=[]
         def visit(node):
@@ -106,25 +160,12 @@ class Optimize:
         return results
     
     def gets(self,field_or_operator,option='field'):
+        #các field / operator cùng group, rank từ cao xuống thấp (tuple, không được sửa)
         if option=='field':
-            #lấy group
-            condition=self.df_rank_fields['id']==field_or_operator
-            group=self.df_rank_fields.loc[condition,'group'].iloc[0] #lấy group
-            #lấy danh sách fields có trong group
-            df_group_fields=self.df_rank_fields[self.df_rank_fields['group']==group] 
-            df_group_fields.sort_values(by='rank',ascending=False,inplace=True) #sort từ cao xuống thấp
-            list_group=list(df_group_fields['id']) #lấy danh sách fields
-
+            list_group=self.rank_fields.similar(field_or_operator)
         elif option=='operator':
-            #lấy group
-            condition=self.df_rank_operators['name']==field_or_operator
-            group=self.df_rank_operators.loc[condition,'group'].iloc[0] #lấy group
-            #lấy danh sách operators có trong group
-            df_group_operators=self.df_rank_operators[self.df_rank_operators['group']==group] 
-            df_group_operators.sort_values(by='rank',ascending=False,inplace=True) #sort từ cao xuống thấp
-            list_group=list(df_group_operators['name']) #lấy danh sách operators
+            list_group=self.rank_operators.similar(field_or_operator)
         
-        list_group.remove(field_or_operator) #xóa phần tử đầu vào ra khỏi danh sách
         #chọn 2 phần tử đầu tiên trong danh sách còn phần tử thứ 3 thì random --> mục đích nhằm giúp cho các biến tốt nhưng hiện tại rank chưa tốt có cơ hội tăng rank
     
         '''if len(list_group)>=3:
@@ -142,7 +183,7 @@ class Optimize:
         '''
         field: str
         '''
-        tree = self.parser.parse(alpha)
+        tree = self.parse(alpha)
         results=[]
         
         #xác định các field similar
@@ -154,7 +195,7 @@ class Optimize:
             for field_new in field_new_list:
                 obj=self.map(field,field_new)[0] #tạo format để chuyển đổi --> vì đầu ra là danh sách 1 giá trị nên dùng [0] thay cho for
                 tree_new=RenameFields(obj).transform(tree) #replace old --> new
-                alpha_new=self.tree_to_expr(tree_new) #chuyển thành dạng biểu thức alpha
+                alpha_new=self.expressions.remember(tree_new) #chuyển thành dạng biểu thức alpha, giữ cây trong cache
                 results.append(alpha_new)
             return results
         else:
@@ -164,7 +205,7 @@ class Optimize:
         '''
         operator: str
         '''
-        tree = self.parser.parse(alpha)
+        tree = self.parse(alpha)
         results=[]
 
         #Xác định danh sách cần chuyển đổi
@@ -175,8 +216,8 @@ class Optimize:
             for op_new in op_new_list:
                 obj=self.map(operator,op_new)[0] #tạo danh sách format để chuyển đổi 
                 tree_new=RenameOperators(obj).transform(tree) #replace
-                alpha_new=self.tree_to_expr(tree_new) #chuyển thành biểu thức alpha
-                results.append(alpha_new)                                
+                alpha_new=self.expressions.remember(tree_new) #chuyển thành biểu thức alpha, giữ cây trong cache
+                results.append(alpha_new)
             return results
         else:
             return None
@@ -185,7 +226,7 @@ class Optimize:
         '''
         operator: str
         '''
-        tree = self.parser.parse(alpha)
+        tree = self.parse(alpha)
         results=[]
 
         #Xác định danh sách cần chuyển đổi
@@ -194,24 +235,46 @@ class Optimize:
 
         for obj in obj_list:
             tree_new=RenameOperators(obj).transform(tree) #replace
-            alpha_new=self.tree_to_expr(tree_new) #chuyển thành biểu thức alpha
+            alpha_new=self.expressions.remember(tree_new) #chuyển thành biểu thức alpha, giữ cây trong cache
             results.append(alpha_new)
         return  results
     
-    def opimize_turnover(self,alpha,simulate_result,decay):
-        turnover=simulate_result[1] #lấy turnover
+    def opimize_turnover(self,alpha,simulate_result,decay,rounds=3):
+        index_turnover=RESULT_COLUMNS.index('turnover')
+        turnover=simulate_result[index_turnover] if len(simulate_result)>index_turnover else None #lấy turnover
         
-        if turnover < 0.2:
+        if turnover is None or turnover < 0.2:
             return simulate_result,decay #nếu <0.2 thì break không cần tối ưu
-        
-        elif turnover > 0.7:
-            decay+=15
-        elif turnover > 0.5:
-            decay+=10
-        elif turnover > 0.2:
-            decay+=5
-        simulate_result=self.wl.single_simulate(alpha,decay=decay,get_corr_and_score=False)
-        return simulate_result,decay
+
+        index_decay=RESULT_COLUMNS.index('decay')
+        if len(simulate_result)>index_decay and simulate_result[index_decay] is not None:
+            decay=int(simulate_result[index_decay]) #decay thật của kết quả hiện tại
+        #bước tăng theo turnover như trước: >0.7 thêm 15, >0.5 thêm 10, còn lại thêm 5; trước đây lặp `rounds` lần
+        #-> simulate song song mọi decay mà các lần lặp đó có thể tới (bội của 5, từ 1 bước đến `rounds` bước)
+        step=15 if turnover>0.7 else 10 if turnover>0.5 else 5
+        decays=list(range(decay+step,decay+rounds*step+1,5))
+        results={}
+        done=set()
+
+        def turnover_of(d):
+            return results[d][index_turnover] if d in results and results[d][index_turnover] is not None else None
+
+        for record in self.wl.sweep_iter([alpha],decay=decays,get_corr_and_score=False,priority='followup',source='optimize'):
+            done.add(int(record['settings']['decay']))
+            if record['status']=='COMPLETE':
+                results[int(record['settings']['decay'])]=record['result']
+            #dừng khi đã biết decay nhỏ nhất đưa turnover về < 0.2: các decay lớn hơn chưa gửi sẽ không simulate
+            for d in decays:
+                if d not in done:
+                    break
+                if turnover_of(d) is not None and turnover_of(d)<0.2:
+                    return results[d],d
+        if not results:
+            return simulate_result,decay
+
+        #không decay nào đưa turnover về < 0.2: lấy decay có turnover thấp nhất
+        best_decay=min(results,key=lambda d: turnover_of(d) if turnover_of(d) is not None else float('inf'))
+        return results[best_decay],best_decay
     
     def map(self,old,new,word=None):
         obj_list=[]
@@ -227,39 +290,7 @@ class Optimize:
 
     #chuyển đổi tree thành công thức
     def tree_to_expr(self,tree):
-        if isinstance(tree, Token):
-            return tree.value
-
-        if tree.data == 'number':
-            return tree.children[0].value
-
-        if tree.data == 'var':
-            return tree.children[0].value
-        
-        if tree.data == 'neg':
-            return '-' + self.tree_to_expr(tree.children[0])
-
-        if tree.data in ('add', 'subtract', 'multiply', 'divide','less','less_equal','greater','greater_equal'):
-            left = self.tree_to_expr(tree.children[0])
-            right = self.tree_to_expr(tree.children[1])
-            op = {'add': '+', 'subtract': '-', 'multiply': '*', 'divide': '/','less':'<','less_equal':'<=','greater':'>','greater_equal':'>='}[tree.data]
-            return f'({left} {op} {right})'
-
-        if tree.data == 'func_call':
-            func_name = tree.children[0].value
-            args = self.tree_to_expr(tree.children[1])
-            return f'{func_name}({args})'
-
-        if tree.data == 'arg_list':
-            return ', '.join(self.tree_to_expr(child) for child in tree.children)
-
-        if tree.data == 'kwarg':
-            key = self.tree_to_expr(tree.children[0])
-            value = self.tree_to_expr(tree.children[1])
-            return f'{key}={value}'
-
-        # fallback: unknown node
-        return tree.data
+        return to_expr(tree)
 
     def run(self,alpha,simulate_result,option_best='sharpe'):
         #results=[]
@@ -282,17 +313,14 @@ class Optimize:
         alpha,best_simulate_result=self.best_alpha(alpha,best_simulate_result,ops,optimize_type='parameter',option_best=option_best)
         print(alpha)
         
-        #tối ưu turnover
-        decay=0 #khởi tạo decay
-        for i in range(0,3): #chạy 3 lần tối ưu
-            best_simulate_result,decay=self.opimize_turnover(alpha,best_simulate_result,decay)
+        #tối ưu turnover: một lần quét các mức decay
+        best_simulate_result,decay=self.opimize_turnover(alpha,best_simulate_result,0)
         
         return alpha,best_simulate_result
     
     def best_alpha(self,alpha,simulate_result,fields_or_operators_list,optimize_type='field',option_best='sharpe'):
 
-        option={"sharpe":0,"fitness":2,"returns":3}
-        index_option=option.get(option_best)
+        index_option=RESULT_COLUMNS.index(option_best) #vị trí chỉ số trong dòng kết quả của locate_alpha
         #simulate alpha đầu tiên
         simulate_results=[simulate_result] #khới tạo phần tử đầu tiên
 
@@ -313,10 +341,10 @@ class Optimize:
                     simulate_results.append(simulate_result)
                     print('alpha: ',alpha_optimize)
                     print('results: ',simulate_result)
-                    self.wks.append_rows([[alpha,alpha_optimize]+simulate_result])
+                    self.sheet_writer.append_row([alpha,alpha_optimize]+simulate_result)
 
                 #lấy index alpha best theo tiêu chuẩn cần tối ưu -- result nếu result = [None] thì khi chọn khác sharpe vẫn xảy ra lỗi
-                results_list_by_option=[ abs(result[index_option]) if result and result[index_option] else 0 for result in  simulate_results] #tạo danh sách giá trị tiêu chuẩn mục tiêu
+                results_list_by_option=[ abs(result[index_option]) if len(result)>index_option and result[index_option] else 0 for result in  simulate_results] #tạo danh sách giá trị tiêu chuẩn mục tiêu
                 index_alpha_best=results_list_by_option.index(max(results_list_by_option)) #index của alpha best
                 
                 #gắn alpha tối ưu vào alpha và tiếp tục quy trình tối ưu field tiếp theo
@@ -331,84 +359,169 @@ class Optimize:
         return alpha,best_simulate_result
     
     #["fields", "operator", "daily&group", "setting"]
-    def complete_search(self, alpha, option):
+    def complete_search(self, alpha, option, limit=None, sample=None, seed=None, processes=None):
+        #danh sách biến thể không trùng lặp, xem iter_search
+        return list(self.iter_search(alpha, option, limit=limit, sample=sample, seed=seed, processes=processes))
+
+    def iter_search(self, alpha, option, limit=None, sample=None, seed=None, processes=None):
+        '''
+        Sinh lần lượt các biến thể của alpha theo option ngay khi tạo ra (cùng thứ tự duyệt
+        như complete_search trước đây), mỗi biến thể một lần theo dạng chuẩn, không gồm chính alpha.
+        limit: dừng sau limit biến thể.
+        sample: mỗi tầng chỉ mở rộng tiếp tối đa sample biến thể, chọn ngẫu nhiên theo seed.
+        processes > 1: các tầng lớn được mở rộng trước trên nhiều tiến trình (xem SearchPrefetcher);
+        kết quả giống hệt bản tuần tự.
+        '''
+        prefetcher = SearchPrefetcher(processes) if processes and processes > 1 else None
+        try:
+            for count, alpha_next in enumerate(self._iter_search(alpha, list(option), sample, seed, prefetcher), 1):
+                yield alpha_next
+                if limit and count >= limit:
+                    return
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+    def _search_steps(self, alpha, option):
+        #(option còn lại, các biến thể của tầng) cho từng bước, theo thứ tự duyệt của complete_search
         fields_ops = self.extract(alpha)
-        
         ops = fields_ops.get('operators')
-        fields = fields_ops.get("fields")
-        fields = list(set(fields) - set(self.groups))  # loại bỏ group
-        
-        results = []
-
-        # ----- xử lý fields -----
-        if "fields" in option:
+        fields = list(set(fields_ops.get("fields")) - set(self.groups))  # loại bỏ group
+
+        steps = [("fields", fields, self.optimize_field),
+                 ("operator", ops, self.optimize_operator),
+                 ("daily&group", ops, self.optimize_parameter)]
+        for name, items, optimize in steps:
+            if name not in option:
+                continue
             new_option = option.copy()
-            new_option.remove("fields")
-
-            temp_results = []
-            for field in fields:
-                res = self.optimize_field(alpha, field)
-                if res is not None: #kiểm tra rỗng
-                    temp_results += res
-
-            results += temp_results
-
-            if new_option:
-                for alpha_next in temp_results:
-                    results += self.complete_search(alpha_next, new_option)
-
-        # ----- xử lý operator -----
-        if "operator" in option:
-            new_option = option.copy()
-            new_option.remove("operator")
-
-            temp_results = []
-            for op in ops: 
-                res = self.optimize_operator(alpha, op)
-                if res is not None: #kiểm tra rỗng
-                    temp_results += res
-
-            results += temp_results
+            new_option.remove(name)
+            yield new_option, (alpha_next for item in items for alpha_next in optimize(alpha, item) or ())
+
+    def _iter_search(self, alpha, option, sample=None, seed=None, prefetcher=None):
+        rng = random.Random(seed)
+        seen = {expression_key(self.canonical(alpha))}  # key dạng chuẩn đã trả về; alpha gốc không phải biến thể
+        expanded = set()  # (key, option còn lại) đã mở rộng: mở rộng lại chỉ ra biến thể trùng
+
+        def search(alpha, option, state=None):
+            if prefetcher is not None and state is not None:
+                steps = prefetcher.expand(alpha, option, state, self._search_steps)
+            else:
+                steps = self._search_steps(alpha, option)
+            for new_option, variants in steps:
+                level = []
+                for alpha_next in variants:
+                    level.append(alpha_next)
+                    key = expression_key(alpha_next)  # biến thể sinh ra đã ở dạng chuẩn
+                    if key not in seen:
+                        seen.add(key)
+                        yield alpha_next
+
+                if new_option:
+                    if sample and len(level) > sample:
+                        level = rng.sample(level, sample)
+                    remaining = tuple(sorted(new_option))
+                    children = [(alpha_next, (expression_key(alpha_next), remaining)) for alpha_next in level]
+                    if prefetcher is not None:
+                        prefetcher.schedule([(alpha_next, new_option, state) for alpha_next, state in children
+                                             if state not in expanded])
+                    for alpha_next, state in children:
+                        if state not in expanded:
+                            expanded.add(state)
+                            yield from search(alpha_next, new_option, state)
+
+        yield from search(alpha, option)
+
+
+PARALLEL_MIN_FRONTIER = 32  # tầng ít trạng thái hơn thì mở rộng ngay tại tiến trình này
+
+_search_pool = None  # (processes, ProcessPoolExecutor) dùng chung, giữ các worker đã nạp sẵn
+_search_pool_lock = threading.Lock()
+
+def search_pool(processes):
+    '''
+    Pool tiến trình dùng chung cho iter_search, tạo một lần theo context 'spawn' (an toàn
+    khi gọi từ GUI nhiều luồng); mỗi worker dựng một Optimize khi khởi động rồi giữ lại.
+    '''
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None or _search_pool[0] != processes:
+            if _search_pool is not None:
+                _search_pool[1].shutdown(wait=False, cancel_futures=True)
+            pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_search_worker)
+            _search_pool = (processes, pool)
+        return _search_pool[1]
+
+class SearchPrefetcher:
+    '''
+    Mở rộng trước trên search_pool các trạng thái (biến thể, option còn lại) mà iter_search
+    sắp duyệt tới. Chỉ tầng có từ min_frontier trạng thái trở lên mới được gửi đi; tầng con
+    được xếp trước các tầng anh em nên thứ tự gửi bám theo thứ tự duyệt, và tối đa window
+    trạng thái chờ kết quả cùng lúc. Việc duyệt, loại trùng và sample vẫn ở tiến trình này
+    nên mỗi trạng thái chỉ được mở rộng một lần và kết quả giống hệt bản tuần tự.
+    '''
+    def __init__(self, processes, min_frontier=PARALLEL_MIN_FRONTIER):
+        self.processes = processes
+        self.min_frontier = min_frontier
+        self.window = processes * 4
+        self.pending = deque()   # (alpha, option, state) chưa gửi, theo thứ tự duyệt
+        self.futures = {}        # state -> Future các bước đã mở rộng
+        self.scheduled = set()
+        self.done = set()        # state đã được duyệt tới, không cần gửi nữa
+
+    def schedule(self, children):
+        children = [child for child in children if child[2] not in self.scheduled]
+        if len(children) < self.min_frontier:
+            return
+        self.scheduled.update(child[2] for child in children)
+        self.pending.extendleft(reversed(children))
+        self._top_up()
+
+    def expand(self, alpha, option, state, search_steps):
+        self.done.add(state)
+        future = self.futures.pop(state, None)
+        self._top_up()
+        if future is None: # chưa gửi đi: mở rộng tại chỗ
+            return search_steps(alpha, option)
+        return future.result()
+
+    def _top_up(self):
+        while self.pending and len(self.futures) < self.window:
+            alpha, option, state = self.pending.popleft()
+            if state not in self.done:
+                self.futures[state] = search_pool(self.processes).submit(_expand_state, alpha, option)
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        self.pending.clear()
+
+_search_worker = None  # Optimize của tiến trình con: parser và chỉ mục rank nạp một lần
+
+def _init_search_worker():
+    global _search_worker
+    sys.stdout = open(os.devnull, 'w')  # tiến trình con không in danh sách thay thế
+    _search_worker = Optimize()
+
+def _expand_state(alpha, option):
+    return [(new_option, list(variants)) for new_option, variants in _search_worker._search_steps(alpha, option)]
 
-            if new_option:
-                for alpha_next in temp_results:
-                    results += self.complete_search(alpha_next, new_option)
-
-        # ----- xử lý daily&group -----
-        if "daily&group" in option:
-            new_option = option.copy()
-            new_option.remove("daily&group")
-
-            temp_results = []
-            for op in ops:
-                temp_results += self.optimize_parameter(alpha, op)
-
-            results += temp_results
-
-            if new_option:
-                for alpha_next in temp_results:
-                    results += self.complete_search(alpha_next, new_option)
-
-        return results
-
-        
 if __name__=='__main__':
     #chạy optimize
     opti=Optimize()
     alpha_list=opti.read_json('./optimize/alpha.json')
     alpha_list=alpha_list.get('Alpha')
-    output=[]
+    #lưu đề phòng: chỉ ghi thêm dòng mới vào csv
+    csv_writer=AsyncWriter(CsvSink('./optimize/optimize_results.csv'),max_rows=1)
     for alpha in alpha_list:
         alpha_optimize,simulate_result=opti.run(alpha)
         result=[alpha,alpha_optimize]+simulate_result
         
         #tiếng hành lưu
-        #lưu đề phòng
-        output.append(result)
-        df_output=pd.DataFrame(output)
-        df_output.to_csv('./optimize/optimize_results.csv')
+        csv_writer.append_row(result)
         #lưu trên sheet
-        try:
-            opti.wks.append_rows([result])
-        except Exception as e:
-            print('ERROR GG SHEET', e)
\ No newline at end of file
+        opti.sheet_writer.append_row(result)
+    csv_writer.close()
+    opti.sheet_writer.close()
\ No newline at end of file
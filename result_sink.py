@@ -0,0 +1,378 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+def is_quota_error(error) -> bool:
+    """gspread APIError for the per-minute read/write quota (HTTP 429)."""
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return True
+    text = str(error).lower()
+    return 'quota' in text or 'rate_limit' in text or '429' in text
+
+
+class ResultSink:
+    """
+    Storage backend for result rows (lists of values).
+
+    `write` stores a batch in one go; if it raises, `AsyncWriter` retries the
+    whole batch later. `update` rewrites rows written earlier under a key;
+    append-only backends store the new version as another row.
+    """
+
+    label = 'sink'
+
+    def journal_name(self) -> str:
+        return re.sub(r'\W+', '_', self.label)
+
+    def write(self, rows: list, keys: list) -> None:
+        raise NotImplementedError
+
+    def update(self, updates: dict) -> None:
+        self.write(list(updates.values()), list(updates.keys()))
+
+    def close(self) -> None:
+        pass
+
+
+class SheetSink(ResultSink):
+    """gspread worksheet; keyed rows are rewritten in place with `batch_update`."""
+
+    label = 'Google Sheet'
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.row_numbers = {} # key -> số dòng trên sheet
+
+    def journal_name(self):
+        spreadsheet_id = getattr(getattr(self.worksheet, 'spreadsheet', None), 'id', 'sheet')
+        worksheet_id = getattr(self.worksheet, 'id', 0)
+        return f'sheet_journal_{spreadsheet_id}_{worksheet_id}'
+
+    def write(self, rows, keys):
+        response = self.worksheet.append_rows(rows, value_input_option='USER_ENTERED')
+        print(f"   -> ĐÃ GHI {len(rows)} DÒNG VÀO GOOGLE SHEET.")
+        updated_range = re.search(r'!\D+(\d+)', (response or {}).get('updates', {}).get('updatedRange', ''))
+        if updated_range:
+            start = int(updated_range.group(1))
+            for offset, key in enumerate(keys):
+                if key is not None:
+                    self.row_numbers[key] = start + offset
+
+    def update(self, updates):
+        data = [{'range': f'A{self.row_numbers[key]}', 'values': [row]}
+                for key, row in updates.items() if key in self.row_numbers]
+        if data:
+            self.worksheet.batch_update(data, value_input_option='USER_ENTERED')
+
+
+class CsvSink(ResultSink):
+    """Append-only CSV file; `header` is written once when the file is created."""
+
+    def __init__(self, path, header=None):
+        self.path = path
+        self.header = header
+        self.label = f'CSV {path}'
+
+    def journal_name(self):
+        return 'csv_journal_' + re.sub(r'\W+', '_', os.path.abspath(self.path))
+
+    def write(self, rows, keys):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, mode='a', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            if new_file and self.header:
+                writer.writerow(self.header)
+            writer.writerows(rows)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class SqliteSink(ResultSink):
+    """
+    SQLite table with one column per entry of `columns` (col_0, col_1, ...
+    when not given), plus `key` and `created`. Keyed rows are replaced in place.
+    """
+
+    def __init__(self, path='./cache/results.sqlite', table='results', columns=None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.table = table
+        self.columns = list(columns) if columns else None
+        self.label = f'SQLite {path}:{table}'
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if self.columns:
+            self._create()
+
+    def journal_name(self):
+        return 'sqlite_journal_' + re.sub(r'\W+', '_', os.path.abspath(self.path) + '_' + self.table)
+
+    def _create(self):
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        with self.conn:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" (key TEXT PRIMARY KEY, created REAL, {columns})')
+
+    def write(self, rows, keys):
+        if self.columns is None: #chưa có tên cột thì lấy theo độ dài dòng đầu
+            self.columns = [f'col_{i}' for i in range(max(len(row) for row in rows))]
+            self._create()
+        width = len(self.columns)
+        placeholders = ', '.join('?' * (width + 2))
+        now = time.time()
+        values = [(key, now, *[self._value(value) for value in (list(row) + [None] * width)[:width]])
+                  for key, row in zip(keys, rows)]
+        with self.conn:
+            self.conn.executemany(f'INSERT OR REPLACE INTO "{self.table}" VALUES ({placeholders})', values)
+
+    @staticmethod
+    def _value(value):
+        if value is None or isinstance(value, (int, float, str, bytes)):
+            return value
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    def close(self):
+        self.conn.close()
+
+
+class ParquetSink(ResultSink):
+    """
+    Parquet part file in `directory` (one per sink, i.e. per run); each batch
+    is a row group, and `pd.read_parquet(directory)` reads every run back.
+    Column types come from the first batch: numeric columns are stored as
+    float64, everything else as string. Requires pyarrow.
+    """
+
+    def __init__(self, directory='./cache/results_parquet', columns=None):
+        import pyarrow # phụ thuộc tuỳ chọn, chỉ cần khi dùng parquet
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.directory = directory
+        self.columns = list(columns) if columns else None
+        self.path = os.path.join(directory, f'part-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.parquet')
+        self.label = f'Parquet {self.path}'
+        self.schema = None
+        self.writer = None
+
+    def journal_name(self):
+        return 'parquet_journal_' + re.sub(r'\W+', '_', os.path.abspath(self.directory))
+
+    def _schema(self, rows):
+        fields = [self.pa.field('key', self.pa.string())]
+        for i, column in enumerate(self.columns):
+            values = [row[i] for row in rows if i < len(row) and row[i] is not None]
+            numeric = values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+            fields.append(self.pa.field(column, self.pa.float64() if numeric else self.pa.string()))
+        return self.pa.schema(fields)
+
+    def write(self, rows, keys):
+        if self.columns is None:
+            self.columns = [f'col_{i}' for i in range(max(len(row) for row in rows))]
+        if self.schema is None:
+            self.schema = self._schema(rows)
+        records = []
+        for key, row in zip(keys, rows):
+            record = {'key': None if key is None else str(key)}
+            for i, field in enumerate(list(self.schema)[1:]):
+                value = row[i] if i < len(row) else None
+                record[field.name] = self._coerce(value, field.type)
+            records.append(record)
+        if self.writer is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.writer = self.pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(self.pa.Table.from_pylist(records, schema=self.schema))
+
+    def _coerce(self, value, dtype):
+        if value is None:
+            return None
+        if dtype == self.pa.float64():
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class AsyncWriter:
+    """
+    Write-behind buffer in front of a `ResultSink`.
+
+    Rows are buffered and handed to the sink by a dedicated thread, one batch
+    when `max_rows` are waiting or the oldest has waited `max_delay` seconds,
+    so result I/O stays off the simulation threads. The buffer is bounded:
+    `append_rows` blocks once `max_pending` rows are waiting. Sink errors
+    (e.g. Sheets quota) back off exponentially instead of dropping the rows,
+    and every unflushed row is kept in a JSONL journal that is replayed on the
+    next start, so a crash doesn't lose results.
+
+    Rows appended with a `key` can be rewritten later with `update_row(key)`
+    (e.g. once the score is known); updates are batched the same way.
+    """
+
+    def __init__(self, sink, max_rows=50, max_delay=10, max_backoff=120, max_pending=10000, journal_path=None):
+        self.sink = sink
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_backoff = max_backoff
+        self.max_pending = max_pending
+        self.journal_path = journal_path or f'./cache/{sink.journal_name()}.jsonl'
+
+        self.pending = []        # (key, row) chưa ghi
+        self.updates = {}        # key -> row cần ghi đè
+        self.rows = {}           # key -> row đã ghi
+        self.dirty = set()       # key đổi giá trị trong lúc đang chờ ghi
+        self.first_pending = None
+        self.flushing = 0        # số lời gọi flush đang chờ: ghi ngay không đợi max_delay
+        self.closing = False
+        self.cond = threading.Condition()
+
+        for row in self._load_journal():
+            self.pending.append((None, row))
+        if self.pending:
+            print(f"   -> Khôi phục {len(self.pending)} dòng chưa ghi từ {self.journal_path}")
+            self.first_pending = time.monotonic()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def append_row(self, row, key=None):
+        self.append_rows([row], keys=[key])
+
+    def append_rows(self, rows, keys=None):
+        keys = keys or [None] * len(rows)
+        with self.cond:
+            while len(self.pending) >= self.max_pending and self.thread.is_alive():
+                self.first_pending = 0 # hàng đợi đầy: ép ghi ngay và chờ
+                self.cond.notify_all()
+                self.cond.wait(1)
+            self._journal(rows)
+            self.pending.extend(zip(keys, rows))
+            if self.first_pending is None:
+                self.first_pending = time.monotonic()
+            self.cond.notify_all()
+
+    def update_row(self, key):
+        """Rewrite the row appended under `key` with its current values."""
+        with self.cond:
+            if any(pending_key == key for pending_key, _ in self.pending):
+                self.dirty.add(key) # ghi lại sau khi append xong nếu bị lỡ giá trị mới
+                return
+            if key in self.rows:
+                self.updates[key] = self.rows[key]
+                if self.first_pending is None:
+                    self.first_pending = time.monotonic()
+                self.cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until everything buffered so far has been written (or `timeout` seconds pass)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            self.flushing += 1 # ép ghi ngay
+            self.cond.notify_all()
+            try:
+                while (self.pending or self.updates) and self.thread.is_alive():
+                    if deadline is not None and time.monotonic() >= deadline:
+                        print(f"   -> Còn {len(self.pending)} dòng chưa ghi, đã lưu trong {self.journal_path}")
+                        return False
+                    self.cond.wait(1)
+            finally:
+                self.flushing -= 1
+        return True
+
+    def close(self, timeout=300):
+        """Flush, stop the background writer and close the sink; rows still unwritten stay in the journal."""
+        if self.flush(timeout):
+            with self.cond:
+                self.closing = True
+                self.cond.notify_all()
+            self.thread.join()
+            self.sink.close()
+
+    def _due(self):
+        if not (self.pending or self.updates):
+            return False
+        return self.flushing or len(self.pending) >= self.max_rows or time.monotonic() - self.first_pending >= self.max_delay
+
+    def _run(self):
+        backoff = 1
+        while True:
+            with self.cond:
+                while not self.closing and not self._due():
+                    self.cond.wait(self.max_delay)
+                if self.closing and not (self.pending or self.updates):
+                    return
+                batch = self.pending[:]
+                updates = dict(self.updates)
+
+            try:
+                if batch:
+                    self.sink.write([row for _, row in batch], [key for key, _ in batch])
+                if updates:
+                    self.sink.update(updates)
+            except Exception as e:
+                kind = 'quota' if is_quota_error(e) else 'error'
+                print(f"   LỖI ({kind}) khi ghi {self.sink.label}, thử lại sau {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+                continue
+
+            backoff = 1
+            with self.cond:
+                del self.pending[:len(batch)]
+                for key, row in batch:
+                    if key is not None:
+                        self.rows[key] = row
+                for key in updates:
+                    if self.updates.get(key) is updates[key]:
+                        del self.updates[key]
+                for key, _ in batch:
+                    if key in self.dirty and key in self.rows:
+                        self.dirty.discard(key)
+                        self.updates[key] = self.rows[key]
+                self.first_pending = time.monotonic() if (self.pending or self.updates) else None
+                self._rewrite_journal()
+                self.cond.notify_all()
+
+    def _journal(self, rows):
+        os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+
+    def _rewrite_journal(self):
+        if not self.pending:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            return
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for _, row in self.pending:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+        os.replace(tmp_path, self.journal_path)
+
+    def _load_journal(self):
+        if not os.path.exists(self.journal_path):
+            return []
+        with open(self.journal_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+class SheetWriter(AsyncWriter):
+    """`AsyncWriter` in front of a gspread worksheet."""
+
+    def __init__(self, worksheet, **kwargs):
+        super().__init__(SheetSink(worksheet), **kwargs)
+        self.worksheet = worksheet
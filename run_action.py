@@ -10,6 +10,9 @@ from google import genai
 
 # Import class WorldQuant của bạn
 from worldquant import WorldQuant
+from simulation import RESULT_COLUMNS
+from cache import JobJournal
+from result_sink import SheetWriter
 
 # --- Các hàm tạo file từ secret (Giữ nguyên) ---
 def tao_cac_file_can_thiet():
@@ -144,18 +147,6 @@ def lay_alpha_da_co(worksheet):
         print(f"Lỗi khi đọc lịch sử alpha: {e}")
         return set()
 
-def ghi_ket_qua_len_google_sheet(worksheet, ket_qua_df):
-    print("\nBắt đầu ghi kết quả lên Google Sheets...")
-    if ket_qua_df.empty:
-        print("Không có kết quả mới để ghi.")
-        return
-    try:
-        data_to_append = ket_qua_df.values.tolist()
-        worksheet.append_rows(data_to_append, value_input_option='USER_ENTERED')
-        print(f"=> Đã ghi thành công {len(data_to_append)} dòng mới.")
-    except Exception as e:
-        print(f"Lỗi khi ghi kết quả: {e}")
-
 # --- HÀM CHẠY CHÍNH ---
 if __name__ == "__main__":
     try:
@@ -167,9 +158,14 @@ if __name__ == "__main__":
         if not results_ws: exit(1)
         alpha_da_co = lay_alpha_da_co(results_ws)
 
+        # alpha còn dở từ lần chạy trước (cron bị ngắt giữa chừng), thư mục ./cache được giữ lại giữa các lần chạy
+        so_alpha_dang_do = len(JobJournal().pending('cron'))
+        if so_alpha_dang_do:
+            print(f"\n=> Còn {so_alpha_dang_do} alpha dở dang từ lần chạy trước.")
+
         # 3. Tạo Alpha mới
         danh_sach_alpha_ung_vien = tao_alpha_moi(so_luong=10)
-        if not danh_sach_alpha_ung_vien:
+        if not danh_sach_alpha_ung_vien and not so_alpha_dang_do:
             print("\nKhông tạo được alpha mới. Kết thúc.")
             exit(0)
             
@@ -178,24 +174,32 @@ if __name__ == "__main__":
         print(f"\n=> Sau khi lọc, có {len(alpha_thuc_su_moi)} alpha thực sự mới cần mô phỏng.")
         print(alpha_thuc_su_moi)
 
-        if not alpha_thuc_su_moi:
+        if not alpha_thuc_su_moi and not so_alpha_dang_do:
             print("\nKhông có alpha mới nào để chạy. Kết thúc chương trình.")
         else:
-            # 5. Chạy mô phỏng
+            # 5. Chạy mô phỏng, ghi từng kết quả lên sheet ngay khi có để không mất khi bị ngắt
             print("\nBắt đầu khởi tạo WorldQuant và chạy mô phỏng hàng loạt...")
             wq = WorldQuant()
-            ket_qua_list = wq.simulate(alpha_thuc_su_moi)
+            writer = SheetWriter(results_ws)
+            ket_qua_list = []
+            for record in wq.simulate_iter(alpha_thuc_su_moi, resume=True, source='cron',
+                                           on_enriched=lambda result, extra: writer.update_row(result[-1])):
+                if record['status'] == 'COMPLETE':
+                    ket_qua_list.append(record['result'])
+                    writer.append_row(record['result'], key=record['alpha_id'])
+                else:
+                    print(f"   Alpha lỗi: {record['expression']} ({record['error']})")
+            wq.enrichment.join() # chờ điền score vào các dòng kết quả
             
             # 6. Ghi kết quả
+            print("\nBắt đầu ghi kết quả lên Google Sheets...")
+            writer.close()
+            wq.metrics.write('./cache/metrics.json') # số request/độ trễ của lần chạy này
             if ket_qua_list:
                 print("\n--- MÔ PHỎNG HOÀN TẤT ---")
-                cols = ['expression','sharpe', 'turnover','fitness','returns','drawdown','margin',
-                        'longCount','shortCount','weight','sub_univese','universe','delay',
-                        'decay','neutralization','truncation','score','code']
-                results_df = pd.DataFrame(ket_qua_list, columns=cols)
+                results_df = pd.DataFrame(ket_qua_list, columns=RESULT_COLUMNS)
                 print("Kết quả nhận được:")
                 print(results_df)
-                ghi_ket_qua_len_google_sheet(results_ws, results_df)
             else:
                 print("\nKhông nhận được kết quả nào từ mô phỏng.")
 
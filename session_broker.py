@@ -0,0 +1,189 @@
+import json
+import os
+import pickle
+import threading
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from cassette import Cassette, CassetteAdapter
+from metrics import Metrics
+from simulation import ConcurrencyController, EnrichmentQueue, SingleFlight
+
+API_URL = 'https://api.worldquantbrain.com'
+AUTH_URL = API_URL + '/authentication'
+
+
+class BrainSession(requests.Session):
+    """
+    requests.Session that re-authenticates once and retries when the API
+    answers 401. Requests without an explicit `timeout` get the broker's, so
+    a dead connection can't hold a worker thread forever. URLs on the real
+    API host are sent to the broker's `api_url` instead (e.g. a local mock).
+    """
+
+    def __init__(self, broker):
+        super().__init__()
+        self.broker = broker
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.broker.request_timeout)
+        is_auth = url.startswith(AUTH_URL)
+        url = self.broker.resolve(url)
+        generation = self.broker.generation
+        response = self._send(method, url, *args, **kwargs)
+        if response.status_code == 401 and not is_auth:
+            print("Session expired, re-authenticating...")
+            if self.broker.reauthenticate(generation):
+                self.broker.metrics.retry(url, 'reauth')
+                response = self._send(method, url, *args, **kwargs)
+        return response
+
+    def _send(self, method, url, *args, **kwargs):
+        try:
+            return super().request(method, url, *args, **kwargs)
+        except Exception as e:
+            self.broker.metrics.observe_error(url, method, e)
+            raise
+
+
+class SessionBroker:
+    """
+    Process-wide authenticated session for WorldQuant Brain.
+
+    Every WorldQuant instance built with the same credentials file shares one
+    broker, so the login and TLS handshakes happen once per process. The
+    session's connection pool is sized for the worker threads that share it,
+    and expired sessions are re-authenticated transparently (one login per
+    expiry, however many threads hit the 401). The broker also holds the
+    account's simulation concurrency controller, the registry of simulations
+    in flight (`simulation.SingleFlight`) and the request metrics
+    (`metrics.Metrics`, fed by a response hook on the session).
+
+    With a `cassette.Cassette` (argument, or the BRAIN_CASSETTE environment
+    variables) the session's traffic is recorded to a file or replayed from it
+    offline.
+    """
+
+    _brokers = {}
+    _brokers_lock = threading.Lock()
+
+    def __init__(self, credentials_path='./credential.json', cookies_path='./session.pkl', pool_size=32,
+                 request_timeout=(10, 60), api_url=None, cassette=None):
+        self.credentials_path = credentials_path
+        # địa chỉ API thật hoặc server giả lập (biến môi trường BRAIN_API_URL)
+        self.api_url = (api_url or os.environ.get('BRAIN_API_URL') or API_URL).rstrip('/')
+        self.request_timeout = request_timeout # (connect, read) giây
+        self.cookies_path = cookies_path
+        self.credentials = None
+        self.url_biometrics = ''
+        self.generation = 0 # tăng mỗi lần đăng nhập lại
+        self.auth_lock = threading.Lock()
+        self.controller = ConcurrencyController() # giới hạn simulation song song của tài khoản
+        self.metrics = Metrics() # số request, độ trễ, status code theo endpoint
+        self.inflight = SingleFlight() # simulation đang chạy, để caller khác chờ thay vì gửi trùng
+        self.enrichment = EnrichmentQueue(metrics=self.metrics) # lấy score ở background, dùng chung cho mọi WorldQuant
+
+        self.sess = BrainSession(self)
+        self.sess.hooks['response'].append(self.metrics.response_hook)
+        # ghi lại / phát lại traffic (biến môi trường BRAIN_CASSETTE, BRAIN_CASSETTE_MODE)
+        self.cassette = cassette or Cassette.from_env()
+        if self.cassette:
+            print(f"Cassette {self.cassette.mode}: {self.cassette.path}")
+            adapter = CassetteAdapter(self.cassette, pool_connections=pool_size, pool_maxsize=pool_size)
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.sess.mount('https://', adapter)
+        self.sess.mount('http://', adapter)
+
+    @classmethod
+    def get(cls, credentials_path='./credential.json'):
+        """Shared broker for `credentials_path`, logging in on first use or when the credentials change."""
+        key = os.path.abspath(credentials_path)
+        with cls._brokers_lock:
+            broker = cls._brokers.get(key)
+            if broker is None:
+                broker = cls(credentials_path)
+                broker.authenticate()
+                cls._brokers[key] = broker
+            elif broker.credentials != broker.load_credentials():
+                broker.authenticate()
+            return broker
+
+    def resolve(self, url: str) -> str:
+        """Point a URL on the real API host at `api_url`."""
+        if self.api_url != API_URL and url.startswith(API_URL):
+            return self.api_url + url[len(API_URL):]
+        return url
+
+    def load_credentials(self):
+        if not os.path.exists(self.credentials_path):
+            return None
+        with open(self.credentials_path) as f:
+            return json.load(f)
+
+    def authenticate(self) -> None:
+        """Set up authentication with WorldQuant Brain."""
+        print(f"Loading credentials from {self.credentials_path}")
+        try:
+            self.credentials = self.load_credentials()
+            if os.path.exists(self.cookies_path): #kiểm tra xem có file cookies chưa
+                print("Found saved session cookies, loading...")
+                with open(self.cookies_path, "rb") as f:
+                    cookies = pickle.load(f)
+                    self.sess.cookies.update(cookies) #load lại session
+                response=self.sess.get(AUTH_URL)
+                print("Kiểm tra kết nối session đã lưu",response.status_code )
+                if response.status_code == 200: #kiểm tra kết nối có thành công chưa
+                    self.url_biometrics="Authentication successful"
+                    return #nếu thành công thì out ra khỏi hàm
+
+            #nếu chưa thành công thì đăng nhập
+            if self.credentials is None:
+                raise FileNotFoundError(self.credentials_path)
+            username, password = self.credentials['username'],self.credentials['password']
+            self.sess.auth = HTTPBasicAuth(username, password)
+
+            print("Authenticating with WorldQuant Brain...")
+            response = self.sess.post(AUTH_URL)
+            print(f"Authentication response status: {response.status_code}")
+            print(f"Authentication response: {response.text[:500]}...")
+
+            self.url_biometrics=self.biometrics(response)
+            if self.url_biometrics:
+                return
+
+            if response.status_code != 201:
+                raise Exception(f"Authentication failed: {response.text}")
+            print("Authentication successful")
+
+        except Exception as e:
+            print(f"Authentication failed: {str(e)}")
+            raise
+        finally:
+            self.generation += 1
+
+    def reauthenticate(self, seen_generation) -> bool:
+        """
+        Log in again unless another thread already did since `seen_generation`.
+        Returns True when the caller should retry its request.
+        """
+        with self.auth_lock:
+            if self.generation != seen_generation:
+                return True
+            try:
+                self.authenticate()
+            except Exception:
+                return False
+            return not self.url_biometrics or self.url_biometrics == "Authentication successful"
+
+    def biometrics(self,response):
+        if response.status_code == requests.status_codes.codes.unauthorized:
+            if response.headers["WWW-Authenticate"] == "persona":
+                url_biometrics=urljoin(response.url,response.headers['Location'])
+                #response=self.sess.post(urljoin(response.url,response.headers['Location']))
+                return url_biometrics
+            else:
+                print("incorrect")
@@ -0,0 +1,756 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import sleep
+import heapq
+import itertools
+import queue as queue_module
+import threading
+import time
+
+from cache import simulation_key
+
+# số payload tối đa trong một multi-simulation của Brain
+MULTI_SIMULATION_LIMIT = 10
+
+SIMULATIONS_URL = 'https://api.worldquantbrain.com/simulations'
+
+# lớp ưu tiên khi tranh slot simulation: số nhỏ được cấp slot trước
+PRIORITIES = {
+    'interactive': 0,  # người dùng đang chờ (GUI)
+    'followup': 1,     # bước tiếp theo của optimizer / combine
+    'bulk': 2,         # khám phá hàng loạt (complete_search, sweep, cron)
+}
+
+# các cột của một dòng kết quả trả về từ WorldQuant.locate_alpha
+RESULT_COLUMNS = ['expression', 'sharpe', 'turnover', 'fitness', 'returns', 'drawdown', 'margin',
+                  'longCount', 'shortCount', 'weight', 'sub_univese', 'universe', 'delay',
+                  'decay', 'neutralization', 'truncation', 'score', 'code']
+
+
+class SimulationJob:
+    """
+    One POST to /simulations and its progress on the server.
+
+    `sim_data` is a single payload, or a list of payloads for a
+    multi-simulation; either way the job occupies one slot and one poll chain.
+    """
+
+    def __init__(self, sim_data):
+        self.sim_data = sim_data
+        self.location = None
+        self.located = []  # (payload, alpha id) của các alpha đã xong
+        self.failed = []   # payload bị lỗi
+        self.error = None
+        self.poll_delay = None
+        self.poll_errors = 0
+        self.deadline = None # time.monotonic() mà simulation phải xong trước đó
+        # mốc thời gian cho metrics: vào hàng đợi, được nhận, server bắt đầu chạy
+        self.created_at = time.monotonic()
+        self.submitted_at = None
+        self.running_at = None
+
+    @property
+    def is_multi(self):
+        return isinstance(self.sim_data, list)
+
+    @property
+    def payloads(self):
+        return self.sim_data if self.is_multi else [self.sim_data]
+
+    @property
+    def alpha_code(self):
+        return ', '.join(sim_data['regular'] for sim_data in self.payloads)
+
+
+def make_record(sim_data, status, result=None, cached=False, error=None):
+    """Structured record for one simulated payload, as yielded by `SimulationExecutor.iter_run`."""
+    record = {
+        'expression': sim_data['regular'],
+        'settings': sim_data['settings'],
+        'status': status,
+        'cached': cached,
+        'alpha_id': result[-1] if result else None,
+        'result': result,
+        'error': error,
+    }
+    if result:
+        record['metrics'] = dict(zip(RESULT_COLUMNS, result))
+    return record
+
+
+class ConcurrencyController:
+    """
+    AIMD limit on simulations in flight for one account.
+
+    The limit grows by one after a full window of accepted submissions and is
+    halved (and submissions paused for the server's Retry-After) when the
+    platform answers 429 / concurrent-simulation-limit; further 429s during
+    that pause belong to the same congestion event and don't halve it again. Slots are counted here
+    so every executor sharing the account shares the same budget.
+
+    Executors with queued work register it with `want(token, priority, source,
+    waiting)`. A free slot then only goes to the best waiting priority class
+    (see PRIORITIES), and within a class to the source holding the fewest
+    slots, least recently served first, so an interactive batch takes the
+    next slot a bulk sweep frees and two bulk pipelines share slots evenly.
+    Running simulations are never interrupted.
+    """
+
+    def __init__(self, initial=3, minimum=1, maximum=10, throttle_pause=5, demand_ttl=5):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.throttle_pause = throttle_pause
+        self.in_flight = 0
+        self.successes = 0
+        self.accepted = 0
+        self.throttles = 0
+        self.max_limit = initial
+        self.blocked_until = 0
+        self.demand_ttl = demand_ttl # nhu cầu không được làm mới sau chừng này giây thì bỏ (executor đã dừng)
+        self.demand = {}             # token -> (priority, source, hạn)
+        self.source_in_flight = {}   # source -> số slot đang giữ
+        self.last_grant = {}         # source -> lần cuối được cấp slot
+        self.lock = threading.Lock()
+
+    def want(self, token, priority=PRIORITIES['bulk'], source=None, waiting=1) -> None:
+        """Register `token`'s queued jobs as competing for slots; `waiting`=0 withdraws them."""
+        with self.lock:
+            if waiting:
+                now = time.monotonic()
+                self.demand[token] = (priority, source, max(now, self.blocked_until) + self.demand_ttl)
+            else:
+                self.demand.pop(token, None)
+
+    def acquire(self, priority=PRIORITIES['bulk'], source=None) -> bool:
+        """Take a slot if the limit allows it, submissions aren't paused and no one ahead of `priority`/`source` waits."""
+        with self.lock:
+            now = time.monotonic()
+            if self.in_flight >= self.limit or now < self.blocked_until:
+                return False
+            if not self._next_in_line(priority, source, now):
+                return False
+            self.in_flight += 1
+            self.source_in_flight[source] = self.source_in_flight.get(source, 0) + 1
+            self.last_grant[source] = now
+            return True
+
+    def _next_in_line(self, priority, source, now) -> bool:
+        for token, (_, _, expires) in list(self.demand.items()):
+            if expires < now:
+                del self.demand[token]
+        rivals = {(rival_priority, rival_source) for rival_priority, rival_source, _ in self.demand.values()}
+        if not rivals:
+            return True
+        best = min(rival_priority for rival_priority, _ in rivals)
+        if priority != best:
+            return priority < best
+
+        def share(rival_source): # cùng lớp: nguồn giữ ít slot hơn, lâu chưa được cấp hơn đi trước
+            return self.source_in_flight.get(rival_source, 0), self.last_grant.get(rival_source, 0)
+
+        return share(source) <= min(share(rival_source) for rival_priority, rival_source in rivals if rival_priority == best)
+
+    def release(self, source=None) -> None:
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if self.source_in_flight.get(source):
+                self.source_in_flight[source] -= 1
+
+    def retry_in(self) -> float:
+        """Seconds until it's worth trying `acquire` again."""
+        return max(0.5, self.blocked_until - time.monotonic())
+
+    def configure(self, initial=None, maximum=None) -> None:
+        """Override the current limit and/or the ceiling it may grow to."""
+        with self.lock:
+            if maximum is not None:
+                self.maximum = maximum
+            if initial is not None:
+                self.limit = initial
+            self.limit = max(self.minimum, min(self.limit, self.maximum))
+            self.max_limit = max(self.max_limit, self.limit)
+
+    def on_success(self) -> None:
+        with self.lock:
+            self.accepted += 1
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self.successes = 0
+                self.max_limit = max(self.max_limit, self.limit)
+
+    def on_throttle(self, retry_after=None) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.throttles += 1
+            self.successes = 0
+            if now < self.blocked_until: # cùng đợt nghẽn với lần giảm trước (các submit đang bay cùng bị 429): không giảm nữa
+                self.blocked_until = max(self.blocked_until, now + (retry_after or self.throttle_pause))
+                return
+            self.limit = max(self.minimum, self.limit // 2)
+            self.blocked_until = now + (retry_after or self.throttle_pause)
+        print(f"   -> Bị giới hạn concurrent simulation, giảm còn {self.limit} luồng.")
+
+    def metrics(self) -> dict:
+        with self.lock:
+            return {'limit': self.limit, 'in_flight': self.in_flight, 'max_limit': self.max_limit,
+                    'accepted': self.accepted, 'throttles': self.throttles}
+
+
+class SingleFlight:
+    """
+    Process-wide registry of simulations in flight, by canonical key
+    (`cache.simulation_key`).
+
+    The first executor to claim a key simulates it; later claims get a Future
+    that resolves to the owner's (status, result, error), so the same
+    expression + settings costs one slot however many callers (GUI, cron job,
+    optimizer) ask for it at once. An owner that stops before finishing
+    resolves its keys as 'ABANDONED' and the waiters claim them again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = {}  # key -> Future của các caller đang chờ
+        self.coalesced = 0
+
+    def claim(self, key):
+        """None if the caller now owns `key`, otherwise a Future of the owner's outcome."""
+        with self.lock:
+            if key not in self.waiters:
+                self.waiters[key] = []
+                return None
+            future = Future()
+            self.waiters[key].append(future)
+            self.coalesced += 1
+            return future
+
+    def resolve(self, key, status, result=None, error=None):
+        with self.lock:
+            waiters = self.waiters.pop(key, [])
+        for future in waiters:
+            future.set_result((status, result, error))
+
+
+def needs_enrichment(result):
+    """A located row whose sharpe qualifies it for a score but which has none yet."""
+    sharpe, score = result[1], result[-2]
+    return bool(sharpe) and abs(sharpe) > 0.3 and score is None
+
+
+class EnrichmentQueue:
+    """
+    Background workers that fill in score (and optionally correlation) for
+    rows returned by `locate_alpha(..., get_corr_and_score=False)`.
+
+    `get_score`/`get_corr` poll for up to 30s each, so they run here instead
+    of holding up the simulation loop. One queue lives on the SessionBroker
+    and is shared by every WorldQuant on it; each row carries the WorldQuant
+    whose cache it is written back to before the caller's
+    `on_update(result, extra)` is called. Workers start on the first `put`.
+    """
+
+    def __init__(self, workers=2, with_corr=False, metrics=None):
+        self.workers = workers
+        self.with_corr = with_corr
+        self.metrics = metrics
+        self.queue = queue_module.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def put(self, wq, result, on_update=None):
+        self._start()
+        self.queue.put((wq, result, on_update))
+
+    def join(self):
+        """Block until every queued row has been enriched."""
+        self.queue.join()
+
+    def _start(self):
+        with self.lock:
+            if self.threads:
+                return
+            self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+            for thread in self.threads:
+                thread.start()
+
+    def _worker(self):
+        while True:
+            wq, result, on_update = self.queue.get()
+            try:
+                self._enrich(wq, result, on_update)
+            except Exception as e:
+                print(f"   LỖI khi lấy score của '{result[-1]}': {e}")
+            finally:
+                self.queue.task_done()
+
+    def _enrich(self, wq, result, on_update):
+        started = time.monotonic()
+        alpha_id = result[-1]
+        extra = {}
+        result[-2] = extra['score'] = wq.get_score(alpha_id)[0]
+        if self.with_corr:
+            extra['min_corr'], extra['max_corr'] = wq.get_corr(alpha_id)
+        if wq.cache:
+            wq.cache.update_result(alpha_id, result)
+        if self.metrics:
+            self.metrics.observe_phase('enrichment', time.monotonic() - started)
+        print(f"   -> ĐÃ BỔ SUNG score cho '{alpha_id}': {extra}")
+        if on_update:
+            on_update(result, extra)
+
+
+class SimulationExecutor:
+    """
+    Keep as many simulations in flight on WorldQuant Brain as `controller` allows.
+
+    Pending simulations sit in a heap ordered by their next poll time, taken
+    from the progress URL's `Retry-After` header or, when the server doesn't
+    send one, an adaptive backoff between `min_poll` and `max_poll` seconds.
+    The dispatcher sleeps exactly until the earliest due poll (or until a
+    request finishes), so no GET is spent on a simulation that isn't due.
+    """
+
+    def __init__(self, wq, slots=3, controller=None, batch_size=1, cache=None, enrichment=None, get_corr_and_score=True,
+                 min_poll=1, max_poll=30, backoff=1.5, max_poll_errors=5, journal=None, timeout=1800,
+                 metrics=None, inflight=None, priority='bulk', source=None):
+        self.wq = wq
+        # không có controller thì cố định `slots` luồng
+        self.controller = controller or ConcurrencyController(initial=slots, minimum=slots, maximum=slots)
+        self.cache = cache
+        self.enrichment = enrichment
+        self.get_corr_and_score = get_corr_and_score
+        self.batch_size = max(1, min(batch_size, MULTI_SIMULATION_LIMIT))
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.backoff = backoff
+        self.max_poll_errors = max_poll_errors
+        self.journal = journal
+        self.timeout = timeout
+        self.metrics = metrics
+        self.inflight = inflight
+        # tranh slot với các executor khác trên cùng controller (xem ConcurrencyController.want)
+        self.priority = PRIORITIES.get(priority, priority)
+        self.priority_name = priority if priority in PRIORITIES else str(priority)
+        self.source = source or f'executor-{id(self)}'
+
+    def iter_run(self, sim_data_list, on_enriched=None):
+        """
+        Simulate every payload in `sim_data_list` and yield a record (see
+        `make_record`) for each one the moment it finishes or fails.
+
+        A new payload is submitted as soon as a simulation leaves its slot.
+        With `batch_size` > 1 the payloads are packed into multi-simulations
+        and every child alpha is located separately. Payloads already in
+        `cache` are answered from it without being submitted.
+
+        The dispatcher runs on its own thread, so a slow consumer never holds
+        up polling. Closing the generator early stops new submissions; the
+        simulations already in flight still finish (and land in the cache).
+
+        With an `enrichment` queue, alphas are located without score and the
+        score is filled in in the background; `on_enriched(result, extra)` is
+        called from the enrichment thread once the row is complete.
+
+        With a `journal` (see `cache.JobJournal`) every state change is
+        persisted: payloads a previous run already submitted are re-attached
+        to their progress URL instead of being posted again, and payloads it
+        saw complete are only located.
+
+        A simulation still running `timeout` seconds after it was accepted (or
+        re-attached) is cancelled on the server, reported with status
+        'TIMEOUT', and its slot goes to the next payload.
+
+        With `inflight` (a `SingleFlight` shared by every executor in the
+        process) a payload another executor is already simulating is not
+        submitted again: its record comes from that simulation.
+
+        Slots of a shared `controller` are granted by `priority` ('interactive',
+        'followup' or 'bulk') and fairly between `source`s of one class.
+        """
+        records = queue_module.Queue()
+        stop = threading.Event()
+        finished = object()
+
+        def dispatch():
+            try:
+                self._dispatch(sim_data_list, records.put, on_enriched, stop)
+            except Exception as e:
+                records.put(e)
+            finally:
+                records.put(finished)
+
+        threading.Thread(target=dispatch, daemon=True).start()
+        try:
+            while True:
+                record = records.get()
+                if record is finished:
+                    return
+                if isinstance(record, Exception):
+                    raise record
+                yield record
+        finally:
+            stop.set()
+
+    def run(self, sim_data_list, on_enriched=None):
+        """Simulate every payload and return all records once the batch is done."""
+        return list(self.iter_run(sim_data_list, on_enriched=on_enriched))
+
+    def _dispatch(self, sim_data_list, emit, on_enriched, stop):
+        journal = self.journal
+        # chỉ trả về record của payload được yêu cầu (multi-simulation khôi phục có thể chứa payload khác)
+        wanted = {simulation_key(sim_data['regular'], sim_data['settings']) for sim_data in sim_data_list}
+
+        def is_wanted(sim_data):
+            return simulation_key(sim_data['regular'], sim_data['settings']) in wanted
+
+        owned = set()  # key mà executor này giữ trong self.inflight
+
+        def settle(sim_data, status, result=None, error=None):
+            key = simulation_key(sim_data['regular'], sim_data['settings'])
+            if key in owned:
+                owned.discard(key)
+                self.inflight.resolve(key, status, result, error)
+
+        def deliver(sim_data, result, cached=False):
+            settle(sim_data, 'COMPLETE', result)
+            if journal:
+                journal.delivered(sim_data)
+            if is_wanted(sim_data):
+                emit(make_record(sim_data, 'COMPLETE', result, cached=cached))
+            if self.enrichment and needs_enrichment(result):
+                self.enrichment.put(self.wq, result, on_enriched)
+
+        misses = []
+        for sim_data in sim_data_list:
+            result = self.cache.get(sim_data['regular'], sim_data['settings']) if self.cache else None
+            if result is None:
+                misses.append(sim_data)
+                continue
+            print(f"   -> CACHE: Alpha '{sim_data['regular']}' đã có kết quả.")
+            deliver(sim_data, result, cached=True)
+
+        # simulation giống hệt đang chạy ở nơi khác trong tiến trình: chờ kết quả của nó.
+        # giữ key trước khi xem journal, để payload executor khác vừa gửi không bị coi là khôi phục
+        followed = []
+        if self.inflight:
+            misses, claimed = [], misses
+            for sim_data in claimed:
+                future = self.claim(sim_data, owned)
+                if future is not None:
+                    followed.append((future, sim_data))
+                    continue
+                result = self.cache.get(sim_data['regular'], sim_data['settings']) if self.cache else None
+                if result is not None: # vừa xong trước khi giữ được key
+                    deliver(sim_data, result, cached=True)
+                else:
+                    misses.append(sim_data)
+
+        # khôi phục từ journal: simulation còn đang chạy và alpha đã xong nhưng chưa lấy kết quả
+        attached, located, fresh = [], [], []
+        try:
+            if journal:
+                journal.queued(misses, self.source)
+                locations = set()
+                for sim_data in misses:
+                    entry = journal.get(sim_data)
+                    if entry and entry['state'] == 'SUBMITTED' and entry['location']:
+                        if entry['location'] not in locations:
+                            locations.add(entry['location'])
+                            payloads = journal.by_location(entry['location'])
+                            job = SimulationJob(payloads if len(payloads) > 1 else payloads[0])
+                            job.location = entry['location']
+                            attached.append(job)
+                            print(f"   -> KHÔI PHỤC: theo dõi tiếp simulation '{job.alpha_code}'")
+                    elif entry and entry['state'] == 'COMPLETE' and entry['alpha_id']:
+                        located.append((sim_data, entry['alpha_id']))
+                    else:
+                        fresh.append(sim_data)
+            else:
+                fresh = misses
+        except Exception:
+            for key in owned: # lỗi trước khi kịp simulate: trả key cho caller đang chờ
+                self.inflight.resolve(key, 'ABANDONED')
+            raise
+
+        queue = deque(attached + [SimulationJob(sim_data) for sim_data in self._pack(fresh)])
+        polls = []  # heap (due, seq, job)
+        seq = itertools.count()
+        tasks = {}  # future -> (kind, job, payload)
+        controller = self.controller
+        # có hàng đợi enrichment thì lấy score sau
+        get_corr_and_score = self.get_corr_and_score and self.enrichment is None
+
+        def schedule_poll(job, delay):
+            now = time.monotonic()
+            if job.deadline is None and self.timeout:
+                job.deadline = now + self.timeout
+            due = now + delay if job.deadline is None else min(now + delay, job.deadline)
+            heapq.heappush(polls, (due, next(seq), job))
+
+        def fail(job, payloads, status='FAILED'):
+            if journal and payloads:
+                journal.failed(payloads, job.error, state=status)
+            for sim_data in payloads:
+                settle(sim_data, status, error=job.error)
+                if is_wanted(sim_data):
+                    emit(make_record(sim_data, status, error=job.error))
+
+        try:
+            with ThreadPoolExecutor(max_workers=controller.maximum * 2) as pool:
+                for sim_data, alpha_id in located:
+                    tasks[pool.submit(self.wq.locate_alpha, alpha_id, get_corr_and_score)] = ('locate', SimulationJob(sim_data), sim_data)
+                for future, sim_data in followed:
+                    tasks[future] = ('follow', SimulationJob(sim_data), sim_data)
+
+                while queue or polls or tasks:
+                    if stop.is_set(): # người dùng dừng: không gửi thêm alpha mới
+                        unsubmitted = [sim_data for job in queue if not job.location for sim_data in job.payloads]
+                        if journal and unsubmitted: # không để lần resume sau coi là việc dở dang
+                            journal.cancelled(unsubmitted)
+                        for job in queue:
+                            for sim_data in job.payloads:
+                                settle(sim_data, 'ABANDONED')
+                        queue.clear()
+
+                    # 1. GỬI YÊU CẦU MỚI NẾU CÒN CHỖ TRỐNG
+                    controller.want(self, self.priority, self.source, len(queue))
+                    while queue and controller.acquire(self.priority, self.source):
+                        job = queue.popleft()
+                        if job.location: # đã gửi ở lần chạy trước, chỉ cần kiểm tra tiếp
+                            schedule_poll(job, 0)
+                            continue
+                        tasks[pool.submit(self._submit, job)] = ('submit', job, None)
+
+                    # 2. KIỂM TRA CÁC SIMULATION ĐẾN HẠN
+                    now = time.monotonic()
+                    while polls and polls[0][0] <= now:
+                        job = heapq.heappop(polls)[2]
+                        if job.deadline is not None and now >= job.deadline: # quá hạn: huỷ trên server, trả slot
+                            job.error = f"TIMEOUT sau {self.timeout}s"
+                            print(f"   -> QUÁ HẠN: huỷ simulation '{job.alpha_code}'.")
+                            tasks[pool.submit(self._cancel, job)] = ('cancel', job, None)
+                            controller.release(self.source)
+                            fail(job, job.payloads, status='TIMEOUT')
+                            continue
+                        tasks[pool.submit(self._poll, job)] = ('poll', job, None)
+
+                    timeout = max(0, polls[0][0] - now) if polls else None
+                    if queue: # còn alpha chờ slot
+                        timeout = min(timeout, controller.retry_in()) if timeout is not None else controller.retry_in()
+                    if not tasks:
+                        sleep(timeout)
+                        continue
+
+                    done, _ = wait(tasks, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                    # 3. XỬ LÝ KẾT QUẢ
+                    for future in done:
+                        kind, job, sim_data = tasks.pop(future)
+
+                        if kind == 'submit':
+                            status, delay = future.result()
+                            if status == 'ACCEPTED':
+                                if journal:
+                                    journal.submitted(job.payloads, job.location)
+                                job.submitted_at = time.monotonic()
+                                self._observe('wait', job.submitted_at - job.created_at)
+                                self._observe(f'wait_{self.priority_name}', job.submitted_at - job.created_at)
+                                controller.on_success()
+                                schedule_poll(job, delay)
+                            elif status == 'THROTTLED':
+                                if self.metrics:
+                                    self.metrics.retry(SIMULATIONS_URL, 'throttled')
+                                controller.release(self.source)
+                                controller.on_throttle(delay)
+                                queue.appendleft(job) # gửi lại khi có slot
+                            else:
+                                controller.release(self.source)
+                                fail(job, job.payloads)
+
+                        elif kind == 'poll':
+                            status, delay = future.result()
+                            if status == 'PENDING':
+                                schedule_poll(job, delay)
+                                continue
+                            controller.release(self.source) # simulation đã rời slot, gửi alpha tiếp theo ngay
+                            self._observe_done(job)
+                            if status == 'COMPLETE':
+                                for sim_data, alpha_id in job.located:
+                                    if journal:
+                                        journal.completed(sim_data, alpha_id)
+                                    tasks[pool.submit(self.wq.locate_alpha, alpha_id, get_corr_and_score)] = ('locate', job, sim_data)
+                                fail(job, job.failed)
+                            else:
+                                fail(job, job.payloads)
+
+                        elif kind == 'locate':
+                            try:
+                                result = future.result()
+                            except Exception as e:
+                                print(f"   LỖI khi lấy kết quả của '{sim_data['regular']}': {e}")
+                                job.error = str(e)
+                                fail(job, [sim_data])
+                                continue
+                            deliver(sim_data, result)
+
+                        elif kind == 'cancel':
+                            future.result()
+
+                        elif kind == 'follow':
+                            status, result, error = future.result()
+                            if status == 'COMPLETE':
+                                deliver(sim_data, result)
+                            elif status == 'ABANDONED': # executor kia đã dừng: tự simulate
+                                if stop.is_set():
+                                    continue
+                                future = self.claim(sim_data, owned)
+                                if future is None:
+                                    queue.append(SimulationJob(sim_data))
+                                else:
+                                    tasks[future] = ('follow', job, sim_data)
+                            else:
+                                job.error = error
+                                fail(job, [sim_data], status)
+        finally:
+            controller.want(self, waiting=0)
+            for key in owned: # dừng giữa chừng: để caller đang chờ tự simulate
+                self.inflight.resolve(key, 'ABANDONED')
+
+    def claim(self, sim_data, owned):
+        """Claim `sim_data` in self.inflight; None (and its key added to `owned`) if this executor should simulate it."""
+        key = simulation_key(sim_data['regular'], sim_data['settings'])
+        future = self.inflight.claim(key)
+        if future is None:
+            owned.add(key)
+        else:
+            print(f"   -> GỘP: Alpha '{sim_data['regular']}' đang được simulate ở nơi khác, chờ kết quả.")
+        return future
+
+    def _pack(self, sim_data_list):
+        """Group payloads into multi-simulations of at most `batch_size`."""
+        if self.batch_size == 1:
+            return list(sim_data_list)
+        sim_data_list = list(sim_data_list)
+        packed = []
+        for start in range(0, len(sim_data_list), self.batch_size):
+            chunk = sim_data_list[start:start + self.batch_size]
+            packed.append(chunk if len(chunk) > 1 else chunk[0]) # multi-simulation cần ít nhất 2 payload
+        return packed
+
+    def _submit(self, job):
+        """
+        POST the payload; return (status, delay). ACCEPTED comes with the delay
+        before the first poll, THROTTLED with the server's Retry-After.
+        """
+        try:
+            print(f"   -> Đang gửi yêu cầu cho: '{job.alpha_code}'")
+            response = self.wq.sess.post(SIMULATIONS_URL, json=job.sim_data)
+            if response.status_code == 201 and response.headers.get('Location'):
+                job.location = response.headers['Location']
+                retry_after = self._retry_after(response)
+                return 'ACCEPTED', self.min_poll if retry_after is None else retry_after
+            if response.status_code == 429 or 'CONCURRENT_SIMULATION_LIMIT' in response.text.upper():
+                return 'THROTTLED', self._retry_after(response)
+            job.error = f"{response.status_code} - {response.text}"
+            print(f"   LỖI khi gửi '{job.alpha_code}': {job.error}")
+        except Exception as e:
+            job.error = str(e)
+            print(f"   LỖI KẾT NỐI: {str(e)}")
+        return 'REJECTED', None
+
+    def _poll(self, job):
+        """GET the progress URL once; return (status, delay before the next poll)."""
+        try:
+            response = self.wq.sess.get(job.location)
+        except Exception as e:
+            job.poll_errors += 1
+            job.error = str(e)
+            if self.metrics:
+                self.metrics.retry(job.location, 'poll_error')
+            print(f"   Lỗi khi kiểm tra trạng thái của '{job.alpha_code}': {e}")
+            if job.poll_errors >= self.max_poll_errors:
+                return 'FAILED', None
+            return 'PENDING', self._next_backoff(job)
+
+        if response.status_code == 404: # simulation không còn trên server (vd. khôi phục từ journal cũ)
+            job.error = f"{response.status_code} - {response.text}"
+            print(f"   -> THẤT BẠI: không tìm thấy simulation của '{job.alpha_code}'.")
+            return 'FAILED', None
+
+        if response.status_code == 200 and response.content:
+            progress = response.json()
+            status = progress.get("status")
+
+            if status in ['COMPLETE', 'WARNING']:
+                print(f"   -> XONG: Alpha '{job.alpha_code}' đã hoàn thành.")
+                if job.is_multi:
+                    self._locate_children(job, progress.get("children", []))
+                else:
+                    job.located = [(job.sim_data, progress.get("alpha"))]
+                return 'COMPLETE', None
+
+            elif status in ["FAILED", "ERROR", "FAIL"]:
+                print(f"   -> THẤT BẠI: Alpha '{job.alpha_code}' đã bị lỗi.")
+                job.error = progress.get("message") or status
+                return 'FAILED', None
+
+            elif job.running_at is None and (status == 'RUNNING' or 'progress' in progress):
+                job.running_at = time.monotonic() # server đã bắt đầu chạy
+
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            return 'PENDING', retry_after
+        return 'PENDING', self._next_backoff(job)
+
+    def _cancel(self, job):
+        """Best-effort DELETE of the progress URL so the server frees the simulation."""
+        try:
+            response = self.wq.sess.delete(job.location)
+            if response.status_code >= 400 and response.status_code != 404:
+                print(f"   Không huỷ được simulation '{job.alpha_code}': {response.status_code} - {response.text}")
+        except Exception as e:
+            print(f"   Lỗi khi huỷ simulation '{job.alpha_code}': {e}")
+
+    def _locate_children(self, job, children):
+        """Resolve the child simulations of a finished multi-simulation to alpha ids, in payload order."""
+        for sim_data, child in zip(job.sim_data, children):
+            try:
+                child_progress = self.wq.sess.get(f'{SIMULATIONS_URL}/{child}').json()
+            except Exception as e:
+                print(f"   Lỗi khi lấy simulation con '{child}': {e}")
+                job.failed.append(sim_data)
+                continue
+            if child_progress.get("alpha"):
+                job.located.append((sim_data, child_progress["alpha"]))
+            else:
+                print(f"   -> THẤT BẠI: simulation con '{child}' không có alpha ({child_progress.get('status')}).")
+                job.failed.append(sim_data)
+        job.failed += job.sim_data[len(children):] # payload không có simulation con
+
+    def _observe(self, phase, seconds):
+        if self.metrics:
+            self.metrics.observe_phase(phase, seconds)
+
+    def _observe_done(self, job):
+        """Record queue (accepted -> running), run (running -> done) and total durations."""
+        if job.submitted_at is None: # khôi phục từ journal, không biết lúc gửi
+            return
+        done = time.monotonic()
+        if job.running_at is not None:
+            self._observe('queue', job.running_at - job.submitted_at)
+            self._observe('run', done - job.running_at)
+        self._observe('total', done - job.submitted_at)
+
+    def _next_backoff(self, job):
+        delay = job.poll_delay or self.min_poll
+        job.poll_delay = min(self.max_poll, delay * self.backoff)
+        return delay
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return max(0.0, float(response.headers.get('Retry-After')))
+        except (TypeError, ValueError):
+            return None
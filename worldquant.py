@@ -1,75 +1,46 @@
 import requests
 import json
-from requests.auth import HTTPBasicAuth
 from typing import List, Dict
 import pandas as pd
 from time import sleep
 import time
-from urllib.parse import urljoin
-import os
-import pickle
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+
+from cache import SimulationCache, CatalogCache, RecordsetStore, JobJournal, canonical_settings, simulation_key
+from result_sink import AsyncWriter, SheetWriter
+from session_broker import SessionBroker
+from simulation import SimulationExecutor
 
 class WorldQuant:
-    def __init__(self,credentials_path='./credential.json'):
+    def __init__(self,credentials_path='./credential.json',cache_path='./cache/simulations.sqlite',journal_path='./cache/jobs.sqlite'):
         print("Initializing AlphaPolisher...")
-        self.sess = requests.Session()
         self.credentials_path=credentials_path
-        self.url_biometrics=''
         self.cookies_path='./session.pkl'
-        self.setup_auth(credentials_path)
+        self.broker=SessionBroker.get(credentials_path) #session dùng chung cho cả tiến trình, chỉ đăng nhập một lần
+        self.sess=self.broker.sess
+        self.controller=self.broker.controller #số simulation song song tự điều chỉnh theo tài khoản
+        self.metrics=self.broker.metrics #số request, độ trễ theo endpoint, thời gian chờ/chạy simulation
+        self.cache=SimulationCache(cache_path) if cache_path else None #cache kết quả simulate theo expression + settings
+        self.catalog_cache=CatalogCache()
+        self.recordsets=RecordsetStore() #pnl, turnover đã tải về
+        self.enrichment=self.broker.enrichment #lấy score ở background, không chặn vòng simulate
+        self.journal=JobJournal(journal_path) if journal_path else None #trạng thái từng simulation, để chạy tiếp khi bị ngắt
 
         #self.operators = self.get_operators()
         #self.data_fields=self.get_datafields()
         print("AlphaPolisher initialized successfully")
+
+    @property
+    def url_biometrics(self):
+        return self.broker.url_biometrics
     
     def setup_auth(self, credentials_path: str) -> None:
-        """Set up authentication with WorldQuant Brain."""
-        print(f"Loading credentials from {credentials_path}")
-        try:
-            if os.path.exists(self.cookies_path): #kiểm tra xem có file cookies chưa
-                print("Found saved session cookies, loading...")
-                with open(self.cookies_path, "rb") as f:
-                    cookies = pickle.load(f)
-                    self.sess.cookies.update(cookies) #load lại session
-                response=self.sess.get("https://api.worldquantbrain.com/authentication")
-                print("Kiểm tra kết nối session đã lưu",response.status_code )
-                if response.status_code == 200: #kiểm tra kết nối có thành công chưa
-                    self.url_biometrics="Authentication successful"
-                    return #nếu thành công thì out ra khỏi hàm
-            
-            #nếu chưa thành công thì đăng nhập 
-            with open(credentials_path) as f:
-                credentials = json.load(f)
-                
-            username, password = credentials['username'],credentials['password']
-            self.sess.auth = HTTPBasicAuth(username, password)
-            
-            print("Authenticating with WorldQuant Brain...")
-            response = self.sess.post('https://api.worldquantbrain.com/authentication')
-            print(f"Authentication response status: {response.status_code}")
-            print(f"Authentication response: {response.text[:500]}...")
-            
-            self.url_biometrics=self.biometrics(response)
-            if self.url_biometrics:
-                return
-            
-            if response.status_code != 201:
-                raise Exception(f"Authentication failed: {response.text}")
-            print("Authentication successful")
-
-        except Exception as e:
-            print(f"Authentication failed: {str(e)}")
-            raise
+        """Set up authentication with WorldQuant Brain (re-login on the shared session)."""
+        self.broker=SessionBroker.get(credentials_path)
+        self.broker.authenticate()
+        self.sess=self.broker.sess
     
-    def biometrics(self,response):
-        if response.status_code == requests.status_codes.codes.unauthorized:
-            if response.headers["WWW-Authenticate"] == "persona":
-                url_biometrics=urljoin(response.url,response.headers['Location'])
-                #response=self.sess.post(urljoin(response.url,response.headers['Location']))
-                return url_biometrics
-            else:
-                print("incorrect")
-
     def get_operators(self) -> Dict:
         """Fetch available operators from WorldQuant Brain API."""
         print("Fetching available operators...")
@@ -95,14 +66,27 @@ class WorldQuant:
         delay: int = 1,
         universe: str = 'TOP3000',
         dataset_id: str = '',
-        search: str = ''
+        search: str = '',
+        max_workers: int = 8,
+        ttl: float = 24*3600
     ):
+        """
+        Fetch the data-field catalog, 50 fields per page with up to `max_workers` pages in flight.
+        The assembled catalog is kept on disk for `ttl` seconds (ttl=0 forces a refetch).
+        """
+        cache_params = {'instrumentType': instrument_type, 'region': region, 'delay': delay,
+                        'universe': universe, 'dataset': dataset_id, 'search': search}
+        datafields_list_flat = self.catalog_cache.get(cache_params, ttl) if ttl else None
+        if datafields_list_flat is not None:
+            return pd.DataFrame(datafields_list_flat)
+
         if len(search) == 0:
             url_template = "https://api.worldquantbrain.com/data-fields?" +\
                 f"&instrumentType={instrument_type}" +\
                 f"&region={region}&delay={str(delay)}&universe={universe}&dataset.id={dataset_id}&limit=50" +\
                 "&offset={x}"
-            count = self.sess.get(url_template.format(x=0)).json()['count'] 
+            first_page = self._get_datafields_page(url_template.format(x=0))
+            count = first_page['count']
             
         else:
             url_template = "https://api.worldquantbrain.com/data-fields?" +\
@@ -110,17 +94,29 @@ class WorldQuant:
                 f"&region={region}&delay={str(delay)}&universe={universe}&limit=50" +\
                 f"&search={search}" +\
                 "&offset={x}"
+            first_page = self._get_datafields_page(url_template.format(x=0))
             count = 100
         
-        datafields_list = []
-        for x in range(0, count, 50):
-            datafields = self.sess.get(url_template.format(x=x))
-            datafields_list.append(datafields.json()['results'])
+        #trang đầu đã có, lấy song song các trang còn lại
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pages = pool.map(lambda x: self._get_datafields_page(url_template.format(x=x)), range(50, count, 50))
+            datafields_list = [first_page['results']] + [page['results'] for page in pages]
      
         datafields_list_flat = [item for sublist in datafields_list for item in sublist]
+        self.catalog_cache.put(cache_params, datafields_list_flat)
      
         datafields_df = pd.DataFrame(datafields_list_flat)
         return datafields_df
+
+    def _get_datafields_page(self, url, retries=5):
+        for _ in range(retries):
+            response = self.sess.get(url)
+            if response.status_code == 429: #bị giới hạn request thì chờ theo Retry-After
+                self.metrics.retry(url, 'throttled')
+                sleep(float(response.headers.get('Retry-After', 2)))
+                continue
+            return response.json()
+        raise Exception(f"Too many requests when fetching {url}")
     
     def get_vec_fields(self, fields):
 
@@ -164,7 +160,7 @@ class WorldQuant:
             lambda var: f"vec_avg({var})"
         )
         return df
-    def generate_sim_data(self, alpha_list,decay,truncation, region, uni, neut):
+    def generate_sim_data(self, alpha_list,decay,truncation, region, uni, neut, delay=1):
         sim_data_list = []
         for alpha in alpha_list:
             simulation_data = {
@@ -173,10 +169,10 @@ class WorldQuant:
                     'instrumentType': 'EQUITY',
                     'region': region,
                     'universe': uni,
-                    'delay': 1,
-                    'decay': 5,
-                    'neutralization': 'INDUSTRY',
-                    'truncation': 0.05,
+                    'delay': delay,
+                    'decay': decay,
+                    'neutralization': neut,
+                    'truncation': truncation,
                     'pasteurization': 'ON',
                     'unitHandling': 'VERIFY',
                     'nanHandling': 'ON',
@@ -188,91 +184,188 @@ class WorldQuant:
             sim_data_list.append(simulation_data)
         return sim_data_list
 
-    def simulate(self, alpha_data: list, worksheet, decay=5, truncation=0.05, neut="INDUSTRY", region='USA', universe='TOP3000'):
+    def settings_grid(self, decay=5, truncation=0.05, neut="INDUSTRY", region='USA', universe='TOP3000', delay=1) -> list:
+        """
+        Cross product of setting values (each argument one value or a list of
+        values), as dicts with these argument names, most promising first (see rank_settings).
+        """
+        axes = {'decay': decay, 'truncation': truncation, 'neut': neut, 'region': region, 'universe': universe, 'delay': delay}
+        axes = {name: list(values) if isinstance(values, (list, tuple, set, range)) else [values] for name, values in axes.items()}
+        grid = [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+        return self.rank_settings(grid)
+
+    def rank_settings(self, grid: list) -> list:
+        """
+        Sort settings by the mean sharpe self.cache has seen for each of their
+        values (averaged over decay, truncation, neut, ...). Values never seen
+        count as the cache-wide average; ties keep the order of `grid`.
+        """
+        stats = self.cache.settings_stats() if self.cache else {}
+        if not stats or len(grid) < 2:
+            return grid
+        overall = sum(count * mean for count, mean in stats.values()) / sum(count for count, mean in stats.values())
+
+        def promise(settings):
+            canonical = json.loads(canonical_settings(self.generate_sim_data(
+                [''], settings['decay'], settings['truncation'], settings['region'], settings['universe'],
+                settings['neut'], settings['delay'])[0]['settings']))
+            means = [stats.get((key, json.dumps(canonical[key])), (0, overall))[1]
+                     for key in ('region', 'universe', 'delay', 'decay', 'neutralization', 'truncation')]
+            return sum(means) / len(means)
+
+        return sorted(grid, key=promise, reverse=True)
+
+    def simulation_executor(self, slots=None, batch_size=1, get_corr_and_score=True, defer_score=True, timeout=1800,
+                            priority='bulk', source=None):
+        """
+        Executor on this session; `slots` pins the concurrency, otherwise self.controller adapts it.
+        With `defer_score` the score is fetched by self.enrichment instead of inside locate_alpha.
+        Simulations still running after `timeout` seconds are cancelled and reported as 'TIMEOUT'.
+        Payloads another executor on the same broker is already simulating are shared, not resubmitted.
+        `priority` ('interactive', 'followup', 'bulk') and `source` decide who gets the next free slot of self.controller.
+        """
+        controller = None if slots else self.controller
+        enrichment = self.enrichment if get_corr_and_score and defer_score else None
+        return SimulationExecutor(self, slots=slots, controller=controller, batch_size=batch_size, cache=self.cache,
+                                  enrichment=enrichment, get_corr_and_score=get_corr_and_score, journal=self.journal,
+                                  timeout=timeout, metrics=self.metrics, inflight=self.broker.inflight,
+                                  priority=priority, source=source)
+
+    def simulate_iter(self, alpha_data: list, decay=5, truncation=0.05, neut="INDUSTRY", region='USA', universe='TOP3000',
+                      slots=None, batch_size=1, get_corr_and_score=True, on_enriched=None, resume=False, delay=1,
+                      priority='bulk', source=None):
+        """
+        Yield one record per alpha as soon as its simulation finishes.
+
+        Records are dicts with expression, settings, status ('COMPLETE'/'FAILED'/'TIMEOUT'),
+        cached, alpha_id, result (the locate_alpha row), metrics (row by column
+        name) and error. Score is filled into `result` in the background;
+        call self.enrichment.join() to wait for it, or pass `on_enriched`.
+
+        With `resume`, payloads an interrupted run of the same `source` left in self.journal
+        (queued, still running, or finished but never delivered) are run too.
+        `priority` / `source`: see simulation_executor.
+        """
+        sim_data_list = self.generate_sim_data(alpha_data, decay, truncation, region, universe, neut, delay)
+        yield from self.run_sim_data_iter(sim_data_list, slots, batch_size, get_corr_and_score, on_enriched, resume,
+                                          priority, source)
+
+    def sweep_iter(self, alpha_data: list, grid=None, slots=None, batch_size=1, get_corr_and_score=True,
+                   on_enriched=None, resume=False, priority='bulk', source=None, **axes):
+        """
+        simulate_iter over every alpha × every settings in `grid` (dicts as
+        returned by settings_grid), or in settings_grid(**axes), e.g.
+        sweep_iter(alphas, decay=[0, 5, 10], neut=['INDUSTRY', 'SUBINDUSTRY']).
+
+        Settings are scheduled in grid order, each for all alphas, so the most
+        promising combinations report first. Duplicate payloads are dropped;
+        ones already in self.cache come back without being simulated.
+        """
+        grid = grid if grid is not None else self.settings_grid(**axes)
+        sim_data_list, seen = [], set()
+        for settings in grid:
+            for sim_data in self.generate_sim_data(alpha_data, settings['decay'], settings['truncation'], settings['region'],
+                                                   settings['universe'], settings['neut'], settings.get('delay', 1)):
+                key = simulation_key(sim_data['regular'], sim_data['settings'])
+                if key not in seen:
+                    seen.add(key)
+                    sim_data_list.append(sim_data)
+        cached = sum(1 for sim_data in sim_data_list
+                     if self.cache and self.cache.get(sim_data['regular'], sim_data['settings']) is not None)
+        print(f"Sweep: {len(alpha_data)} alpha x {len(grid)} settings -> {len(sim_data_list)} simulation "
+              f"({cached} đã có trong cache)")
+        yield from self.run_sim_data_iter(sim_data_list, slots, batch_size, get_corr_and_score, on_enriched, resume,
+                                          priority, source)
+
+    def run_sim_data_iter(self, sim_data_list: list, slots=None, batch_size=1, get_corr_and_score=True, on_enriched=None, resume=False,
+                          priority='bulk', source=None):
+        """Run ready-made payloads (see generate_sim_data) through the executor, yielding records as in simulate_iter."""
+        if resume and self.journal:
+            keys = {JobJournal.key(sim_data) for sim_data in sim_data_list}
+            leftover = [sim_data for sim_data in self.journal.pending(source) if JobJournal.key(sim_data) not in keys]
+            if leftover:
+                print(f"Khôi phục {len(leftover)} alpha còn dở từ lần chạy trước.")
+            sim_data_list = leftover + sim_data_list
+        executor = self.simulation_executor(slots, batch_size, get_corr_and_score, priority=priority, source=source)
+        yield from executor.iter_run(sim_data_list, on_enriched=on_enriched)
+
+    def simulate(self, alpha_data: list, worksheet=None, decay=5, truncation=0.05, neut="INDUSTRY", region='USA', universe='TOP3000', slots=None, batch_size=1, sink=None, resume=False, delay=1,
+                 priority='bulk', source=None):
         """
         Chạy mô phỏng và ghi kết quả vào Google Sheet ngay khi có.
+        `sink` (một ResultSink: CsvSink, SqliteSink, ParquetSink, ...) thay cho Google Sheet nếu không truyền `worksheet`.
+        `slots` cố định số simulation chạy song song; mặc định (None) tự điều chỉnh theo self.controller.
+        `batch_size` > 1 gộp tối đa 10 alpha vào một multi-simulation.
+        `resume` chạy tiếp cả các alpha còn dở trong self.journal từ lần chạy bị ngắt trước.
+        `priority` ('interactive' cho GUI, 'followup', 'bulk') và `source` quyết định ai được slot trống tiếp theo.
         """
-        print(f"Bắt đầu mô phỏng và ghi实时 {len(alpha_data)} alpha với giới hạn 3 luồng.")
-        
-        sim_data_list = self.generate_sim_data(alpha_data, decay, truncation, region, universe, neut)
-        
-        pending_urls = {} 
-        data_iterator = iter(sim_data_list)
+        print(f"Bắt đầu mô phỏng và ghi {len(alpha_data)} alpha với giới hạn {slots or self.controller.limit} luồng.")
+        return self.write_records(
+            lambda on_enriched: self.simulate_iter(alpha_data, decay, truncation, neut, region, universe, slots=slots,
+                                                   batch_size=batch_size, on_enriched=on_enriched, resume=resume, delay=delay,
+                                                   priority=priority, source=source),
+            worksheet, sink)
+
+    def sweep(self, alpha_data: list, worksheet=None, grid=None, slots=None, batch_size=1, sink=None, resume=False,
+              priority='bulk', source=None, **axes):
+        """
+        Như simulate nhưng chạy mọi alpha với mọi settings trong lưới (xem sweep_iter), vd.
+        sweep(alphas, sink=CsvSink('sweep.csv'), decay=[0, 5, 10], truncation=[0.05, 0.1]).
+        """
+        print(f"Bắt đầu sweep {len(alpha_data)} alpha với giới hạn {slots or self.controller.limit} luồng.")
+        return self.write_records(
+            lambda on_enriched: self.sweep_iter(alpha_data, grid, slots=slots, batch_size=batch_size,
+                                                on_enriched=on_enriched, resume=resume, priority=priority, source=source,
+                                                **axes),
+            worksheet, sink)
+
+    def write_records(self, run, worksheet=None, sink=None):
+        """Ghi các record COMPLETE của run(on_enriched) vào worksheet / sink; trả về số dòng đã ghi."""
         results_count = 0 # Đếm số kết quả đã ghi
+        #ghi kết quả theo lô ở background
+        writer = SheetWriter(worksheet) if worksheet else AsyncWriter(sink) if sink else None
 
-        while True:
-            # 1. GỬI YÊU CẦU MỚI NẾU CÒN CHỖ TRỐNG
-            while len(pending_urls) < 3:
-                sim_data = next(data_iterator, None)
-                if sim_data is None:
-                    break 
-
-                try:
-                    alpha_code = sim_data['regular']
-                    print(f"   -> Đang gửi yêu cầu cho: '{alpha_code}'")
-                    response = self.sess.post('https://api.worldquantbrain.com/simulations', json=sim_data)
-                    
-                    if response.status_code == 201:
-                        location_url = response.headers.get('Location')
-                        if location_url:
-                            pending_urls[location_url] = alpha_code
-                    else:
-                        print(f"   LỖI khi gửi '{alpha_code}': {response.status_code} - {response.text}")
-                except Exception as e:
-                    print(f"   LỖI KẾT NỐI: {str(e)}")
-
-            if not pending_urls:
-                break
-
-            # 2. KIỂM TRA VÀ GHI KẾT QUẢ NGAY LẬP TỨC
-            completed_urls = []
-            for url, alpha_code in pending_urls.items():
-                try:
-                    progress_response = self.sess.get(url)
-                    if progress_response.status_code == 200:
-                        progress = progress_response.json()
-                        status = progress.get("status")
-
-                        if status in ['COMPLETE', 'WARNING']:
-                            print(f"   -> XONG: Alpha '{alpha_code}' đã hoàn thành.")
-                            alpha_id = progress.get("alpha")
-                            result = self.locate_alpha(alpha_id, get_corr_and_score=True)
-                            
-                            # **LOGIC MỚI: GHI KẾT QUẢ VÀO SHEET NGAY LẬP TỨC**
-                            if result and worksheet:
-                                try:
-                                    worksheet.append_row(result, value_input_option='USER_ENTERED')
-                                    print(f"   -> ĐÃ GHI KẾT QUẢ CỦA '{alpha_code}' VÀO GOOGLE SHEET.")
-                                    results_count += 1
-                                except Exception as sheet_error:
-                                    print(f"   LỖI: Không thể ghi vào Google Sheet: {sheet_error}")
-                            
-                            completed_urls.append(url)
-                            break 
-                        
-                        elif status in ["FAILED", "ERROR", "FAIL"]:
-                            print(f"   -> THẤT BẠI: Alpha '{alpha_code}' đã bị lỗi.")
-                            completed_urls.append(url)
-                            break
-                except Exception as e:
-                    print(f"   Lỗi khi kiểm tra trạng thái của '{alpha_code}': {e}")
-                    completed_urls.append(url)
-                    break
-            
-            # 3. DỌN DẸP
-            if completed_urls:
-                for url in completed_urls:
-                    if url in pending_urls:
-                        del pending_urls[url]
-            else:
-                sleep(5)
+        def write_score(result, extra):
+            if writer:
+                writer.update_row(result[-1]) #ghi lại dòng khi đã có score
+
+        for record in run(write_score):
+            if record['status'] == 'COMPLETE' and writer:
+                writer.append_row(record['result'], key=record['alpha_id'])
+                results_count += 1
+        self.enrichment.join() #chờ điền xong score trước khi kết thúc
+        if writer:
+            writer.close()
 
-        print(f"\nĐã mô phỏng xong. Tổng cộng đã ghi {results_count} kết quả vào Google Sheet.")
+        print(f"\nĐã mô phỏng xong. Tổng cộng đã ghi {results_count} kết quả vào {writer.sink.label if writer else 'Google Sheet'}.")
+        print(f"Concurrency: {self.controller.metrics()}")
         # Hàm này không cần trả về kết quả nữa vì đã ghi trực tiếp
         return results_count
+
+    def single_simulate(self, single_alpha: str, decay=5, truncation=0.05, neut="INDUSTRY", region='USA', universe='TOP3000', get_corr_and_score=True, delay=1,
+                        priority='followup', source=None) -> list:
+        """
+        Simulate one alpha and return its locate_alpha row, or [None] if the simulation failed.
+        Defaults to the 'followup' priority: callers (optimizer, combine) are waiting on the result.
+        """
+        sim_data_list = self.generate_sim_data([single_alpha], decay, truncation, region, universe, neut, delay)
+        executor = self.simulation_executor(get_corr_and_score=get_corr_and_score, defer_score=False,
+                                            priority=priority, source=source)
+        for record in executor.iter_run(sim_data_list):
+            if record['status'] == 'COMPLETE':
+                return record['result']
+        return [None]
     
     #hiệu quả alpha    
     def locate_alpha(self, alpha_id,get_corr_and_score=True):
+        triple = self.cache.get_by_alpha(alpha_id) if self.cache else None
+        if triple: #alpha đã có trong cache
+            sharpe=triple[1]
+            if get_corr_and_score and sharpe and abs(sharpe) >0.3 and triple[-2] is None: #bổ sung score còn thiếu
+                triple[-2]=self.get_score(alpha_id)[0]
+                self.cache.update_result(alpha_id,triple)
+            return triple
+
         alpha = self.sess.get("https://api.worldquantbrain.com/alphas/" + alpha_id)
         
         string = alpha.content.decode('utf-8')
@@ -313,6 +406,8 @@ class WorldQuant:
             triple+=[None]
             triple+=[code]
         triple = [ i if i != 'None' else None for i in triple]
+        if self.cache:
+            self.cache.put(expression,settings,code,triple)
         return triple
 
     def get_corr(self,alpha_id):
@@ -334,6 +429,7 @@ class WorldQuant:
             if time.time() - start_time > timeout:
                 return [None,None]  # thoát nếu đã vượt quá 30 giây
             
+            self.metrics.retry(corr_respond.url, 'not_ready')
             sleep(5)
 
     def get_score(self,alpha_id):
@@ -355,28 +451,54 @@ class WorldQuant:
             if time.time() - start_time > timeout:
                 return [None]  # thoát nếu đã vượt quá 30 giây
             
+            self.metrics.retry(performance_respone.url, 'not_ready')
             sleep(5)
         
-    def get_pl(self,alpha_id):
+    def get_recordset(self,alpha_id,name,timeout=120,max_delay=15):
+        """
+        Fetch /alphas/{id}/recordsets/{name}, waiting for it to be generated.
+        Honors Retry-After, otherwise backs off exponentially; returns None after `timeout` seconds.
+        """
+        start_time = time.time()
+        delay = 1
         while True:
-            pl_obj=self.sess.get(f'https://api.worldquantbrain.com/alphas/{alpha_id}/recordsets/pnl')
-            if pl_obj.content:
-                pl=pl_obj.json()
-                pl=pl.get('records')
-                pl=pd.DataFrame(pl,columns=['date','returns'])
-                pl['returns']=pl['returns']-pl['returns'].shift(1)
-                pl.dropna(inplace=True)
-                return pl
+            response=self.sess.get(f'https://api.worldquantbrain.com/alphas/{alpha_id}/recordsets/{name}')
+            if response.status_code == 200 and response.content:
+                return response.json()
+
+            retry_after = response.headers.get('Retry-After')
+            wait = float(retry_after) if retry_after else delay
+            if time.time() - start_time + wait > timeout:
+                print(f"Hết thời gian chờ recordset {name} của alpha {alpha_id}")
+                return None
+            self.metrics.retry(response.url, 'not_ready')
+            sleep(wait)
+            delay = min(max_delay, delay * 2)
+
+    def get_recordset_frame(self,alpha_id,name,column):
+        """Recordset as a (date, column) DataFrame, fetched once and then read from the local store."""
+        series=self.recordsets.get(name,alpha_id)
+        if series is None:
+            recordset=self.get_recordset(alpha_id,name)
+            if recordset is None:
+                return None
+            series=self.recordsets.put(name,alpha_id,recordset.get('records'))
+        return pd.DataFrame({'date':series.index,column:series.values})
+
+    def get_pl(self,alpha_id):
+        pl=self.get_recordset_frame(alpha_id,'pnl','returns')
+        if pl is None:
+            return None
+        pl['returns']=pl['returns']-pl['returns'].shift(1)
+        pl.dropna(inplace=True)
+        return pl
             
     def get_turnover(self,alpha_id):
-        while True:
-            turnover_obj=self.sess.get(f'https://api.worldquantbrain.com/alphas/{alpha_id}/recordsets/turnover')
-            if turnover_obj.content:
-                turnover=turnover_obj.json()
-                turnover=turnover.get('records')
-                turnover=pd.DataFrame(turnover,columns=['date','turnover'])
-                turnover.dropna(inplace=True)
-                return turnover
+        turnover=self.get_recordset_frame(alpha_id,'turnover','turnover')
+        if turnover is None:
+            return None
+        turnover.dropna(inplace=True)
+        return turnover
     
 if __name__=="__main__":
     WorldQuant()